@@ -21,7 +21,6 @@
 
 # %%
 import os
-import requests
 import pyogrio
 import re
 import zipfile
@@ -41,6 +40,9 @@ import morpc
 sys.path.append(os.path.normpath('../morpc-parcel-fetch/'))
 import morpcParcels
 
+# Keep the directory listings and other GET responses between runs and only download them again when they change
+morpcParcels.configure_http_cache(enabled=True)
+
 # %% [markdown]
 # # Download Data
 
@@ -55,7 +57,7 @@ import morpcParcels
 
 # %%
 ftp_url = 'https://apps.franklincountyauditor.com/GIS_Shapefiles/CurrentExtracts/'
-r = requests.get(os.path.dirname(ftp_url))
+r = morpcParcels.http_get(os.path.dirname(ftp_url))
 files = re.findall(r'.zip">(.*?.zip)<', r.text)
 for file in files:
     if "GeoDataBase" in file:
@@ -65,7 +67,8 @@ for file in files:
 if not os.path.exists('./input_data/franklin_data/'):
     os.makedirs('./input_data/franklin_data/')
 
-morpcParcels.download_and_unzip_archive(url=ftp_url, filename=filename, temp_dir='./input_data/franklin_data/')
+# The geodatabase extracts to several GB, so keep the zip and read the layers from inside it
+franklin_gdb_zip = morpcParcels.download_and_unzip_archive(url=ftp_url, filename=filename, temp_dir='./input_data/franklin_data/', connections=4, extract=False)
 
 # %% [markdown]
 # Download Franklin cama from ftp site:
@@ -76,11 +79,11 @@ morpcParcels.download_and_unzip_archive(url=ftp_url, filename=filename, temp_dir
 
 # %%
 init_url = "https://apps.franklincountyauditor.com/Outside_User_Files/"
-r = requests.get(os.path.dirname(init_url))
+r = morpcParcels.http_get(os.path.dirname(init_url))
 pattern = r'<A HREF="/Outside_User_Files/([^/]+/)">'
 years = re.findall(pattern, r.text) ## Finding the folder names for years
 temp_url = os.path.join(init_url, years[-1]) ## Get URL for the correct year
-r = requests.get(temp_url)
+r = morpcParcels.http_get(temp_url)
 pattern = f'<A HREF="/Outside_User_Files/{years[-1]}([^/]+/)">'
 dirs = re.findall(pattern, r.text)
 appraisal_dirs = []
@@ -94,7 +97,7 @@ if not os.path.exists('./input_data/franklin_data/cama/'):
     os.makedirs('./input_data/franklin_data/cama/')
 
 # %%
-morpcParcels.download_and_unzip_archive(url=appraisal_url, filename='Excel.zip', temp_dir='./input_data/franklin_data/cama/appraisal/', keep_zip=True)
+franklin_cama_zip = morpcParcels.download_and_unzip_archive(url=appraisal_url, filename='Excel.zip', temp_dir='./input_data/franklin_data/cama/appraisal/', connections=4, extract=False)
 
 # %% [markdown]
 # ## Parcel Geometry
@@ -103,7 +106,7 @@ morpcParcels.download_and_unzip_archive(url=appraisal_url, filename='Excel.zip',
 # Import raw parcel files from archived file.
 
 # %%
-parcels_raw = pyogrio.read_dataframe('./input_data/franklin_data/Output/FCA_SDE_Web_Prod.gdb/', layer='TaxParcel_CondoUnitStack_LGIM')
+parcels_raw = morpcParcels.read_zipped_layer(franklin_gdb_zip, 'Output/FCA_SDE_Web_Prod.gdb', layer='TaxParcel_CondoUnitStack_LGIM')
 
 # %% [markdown]
 # Drop unneeded columns. 
@@ -148,7 +151,7 @@ parcels = gpd.GeoDataFrame(parcels, geometry='geometry')
 # Import address points from archived geodataframe
 
 # %%
-addr_raw = pyogrio.read_dataframe('./input_data/franklin_data/Output/FCA_SDE_Web_Prod.gdb/', layer='LBRS_AddressPoints')
+addr_raw = morpcParcels.read_zipped_layer(franklin_gdb_zip, 'Output/FCA_SDE_Web_Prod.gdb', layer='LBRS_AddressPoints')
 
 # %% [markdown]
 # Get units from spatial join of address points which are inside parcels. 
@@ -165,7 +168,15 @@ units = parcels.sjoin(addr_raw[['LSN', 'geometry']]).groupby('PARCELID').agg({'L
 # These are combined and the most recent year is assigned to the parcel id. 
 
 # %%
-building_raw = pl.read_excel(os.path.join('./input_data/franklin_data/cama/appraisal/Build.xlsx')).to_pandas()
+# Read only the needed columns of both workbooks with calamine, straight from the zip. After the first run they come
+# from the CAMA cache until Excel.zip changes.
+appraisal = morpcParcels.extract_tables_from_cama(franklin_cama_zip, tables={
+    'Build.xlsx':['PARCEL ID', 'CARD', 'YRBLT'],
+    'Dwelling.xlsx':['PARCEL ID', 'CARD', 'YRBLT'],
+}, max_workers=2, engine='polars')
+
+# %%
+building_raw = appraisal['Build.xlsx']
 building = building_raw[['PARCEL ID', 'CARD', 'YRBLT']].copy()
 building = (building[['PARCEL ID', 'CARD', 'YRBLT']]
  .drop_duplicates()
@@ -174,7 +185,7 @@ building = (building[['PARCEL ID', 'CARD', 'YRBLT']]
  }).reset_index())
 
 # %%
-dwelling_raw = pl.read_excel(os.path.join('./input_data/franklin_data/cama/appraisal/Dwelling.xlsx')).to_pandas()
+dwelling_raw = appraisal['Dwelling.xlsx']
 dwelling = dwelling_raw[['PARCEL ID', 'CARD', 'YRBLT']].copy()
 dwelling = (dwelling[['PARCEL ID', 'CARD', 'YRBLT']]
  .drop_duplicates()
@@ -137,18 +137,21 @@ parcels_raw.crs
 addr = pyogrio.read_dataframe('./input_data/knox_data/address/AddressPts.shp')
 
 # %%
-extract = pd.read_csv('./input_data/knox_data/cama/MVP1_OH_Extract.txt', sep="|", dtype='str')
-build = pd.read_csv('./input_data/knox_data/cama/MVP1_OH_Building.txt', sep="|", dtype='str')
-dwell = pd.read_csv('./input_data/knox_data/cama/MVP1_OH_Dwelling.txt', sep="|", dtype='str')
+# Parse only the needed columns of the pipe delimited extracts, on several threads with pyarrow
+knox_cama = morpcParcels.extract_tables_from_cama('./input_data/knox_data/cama/CAMADatabase.zip', tables={
+    'MVP1_OH_Extract.txt':['mpropertyNumber', 'CardCount', 'mClassificationId', 'macres'],
+    'MVP1_OH_Building.txt':['PropertyNumber', 'CardNumber', 'YearBuilt'],
+    'MVP1_OH_Dwelling.txt':['PropertyNumber', 'CardNumber', 'YearBuilt'],
+}, engine='pyarrow')
 
 # %%
-extract = extract[['mpropertyNumber', 'CardCount', 'mClassificationId', 'macres']].set_index('mpropertyNumber')
+extract = knox_cama['MVP1_OH_Extract.txt'].set_index('mpropertyNumber')
 
 # %%
-build  = build[['PropertyNumber', 'CardNumber', 'YearBuilt']].set_index('PropertyNumber')
+build  = knox_cama['MVP1_OH_Building.txt'].set_index('PropertyNumber')
 
 # %%
-dwell = dwell[['PropertyNumber', 'CardNumber', 'YearBuilt']].set_index('PropertyNumber')
+dwell = knox_cama['MVP1_OH_Dwelling.txt'].set_index('PropertyNumber')
 
 # %%
 cama = extract.join(pd.concat([dwell, build])).reset_index()
@@ -15,13 +15,10 @@
 
 # %%
 import os
-import requests
 import re
 import geopandas as gpd
 import pandas as pd
-import shapely
 import itables
-from IPython.display import clear_output
 import plotnine
 import sys
 
@@ -32,55 +29,11 @@ import morpcParcels
 
 # %%
 url = 'https://apps.lickingcounty.gov/arcgis/rest/services/Auditor/Parcels/MapServer/0'
-count_url = f"{url}/query?outFields=*&where=1%3D1&f=json&returnCountOnly=true"
-json_url = f"{url}/?f=pjson"
-geojson_url = f"{url}/query?outFields=*&where=1%3D1&f=json"
-
-# %%
-# Request the total record count from the API
-r = requests.get(count_url)
-# Extract the JSON from the API response
-result = r.json()
-# Extract the total record count from the JSON
-totalRecordCount = int(re.findall('[0-9]+',str(r.json()))[0])
-
-r = requests.get(json_url)
-result = r.json()
-maxRecordCount = result['maxRecordCount']
-maxRecordCount = 1000
-crs = result['extent']['spatialReference']['latestWkid']
-
-
-firstTime = True
-offset = 0
-exceededLimit = True
-while offset < totalRecordCount:
-    r = requests.get(f"{geojson_url}&resultOffset={offset}&resultRecordCount={maxRecordCount}")
-    result = r.json()
-    
-    geom = []
-    for feat in result['features']:
-        geom.append(shapely.geometry.Polygon(feat['geometry']['rings'][0]))
-        
-    attr = []
-    for feat in result['features']:
-        attr.append(feat['attributes'])
-        
-    temp = gpd.GeoDataFrame(attr, geometry=geom)
-    
-    if firstTime:
-        # If this is the first chunk of data, create a permanent copy of the GeoDataFrame that we can append to
-        gdf = temp.copy()
-        firstTime = False
-    else:
-        # If this is not the first chunk, append to the permanent GeoDataFrame
-        gdf = pd.concat([gdf, temp], axis='index')
-
-    offset += maxRecordCount
-    print(f"{offset} of {totalRecordCount}")
-    clear_output(wait = True)
-
-gdf = gdf.set_crs(str(crs))
+
+# %%
+# The Licking MapServer layers are requested as Esri JSON. Offset paging is unreliable on the parcel layer, so fetch
+# it in envelope tiles instead.
+gdf = morpcParcels.gdf_from_services(url, f='json', pagination='tiles', max_workers=4)
 
 # %%
 parcels_raw = gdf
@@ -90,53 +43,9 @@ parcels_raw.to_file('./input_data/licking_data/parcels/licking_parcels.shp')
 
 # %%
 url = 'https://apps.lickingcounty.gov/arcgis/rest/services/Auditor/Addresses/MapServer/1'
-count_url = f"{url}/query?outFields=*&where=1%3D1&f=json&returnCountOnly=true"
-json_url = f"{url}/?f=pjson"
-geojson_url = f"{url}/query?outFields=*&where=1%3D1&f=json"
-
-# %%
-# Request the total record count from the API
-r = requests.get(count_url)
-# Extract the JSON from the API response
-result = r.json()
-# Extract the total record count from the JSON
-totalRecordCount = int(re.findall('[0-9]+',str(r.json()))[0])
-
-r = requests.get(json_url)
-result = r.json()
-maxRecordCount = result['maxRecordCount']
-maxRecordCount = 1000
-crs = result['extent']['spatialReference']['latestWkid']
-
-
-firstTime = True
-offset = 0
-exceededLimit = True
-while offset < totalRecordCount:
-    r = requests.get(f"{geojson_url}&resultOffset={offset}&resultRecordCount={maxRecordCount}")
-    result = r.json()
-    
-    geom = gpd.GeoSeries.from_xy([sorted(x['geometry'].values())[1] for x in result['features']], [sorted(x['geometry'].values())[0] for x in result['features']])
-        
-    attr = []
-    for feat in result['features']:
-        attr.append(feat['attributes'])
-        
-    temp = gpd.GeoDataFrame(attr, geometry=geom, crs=crs)
-    
-    if firstTime:
-        # If this is the first chunk of data, create a permanent copy of the GeoDataFrame that we can append to
-        gdf = temp.copy()
-        firstTime = False
-    else:
-        # If this is not the first chunk, append to the permanent GeoDataFrame
-        gdf = pd.concat([gdf, temp], axis='index')
-
-    offset += maxRecordCount
-    print(f"{offset} of {totalRecordCount}")
-    clear_output(wait = True)
-
-gdf = gdf.set_crs(str(crs))
+
+# %%
+gdf = morpcParcels.gdf_from_services(url, f='json', page_size='auto')
 
 # %%
 addr_raw = gdf
@@ -81,10 +81,14 @@ morpcParcels.download_and_unzip_archive(url=os.path.dirname(cama_url), filename=
 parcels = parcels[['Parcel_N_1', 'Land_Use_C', 'Acres', 'geometry']]
 
 # %%
-build = morpcParcels.extract_fields_from_cama('./logan_data/cama/PublicRecordsExcel.zip', filename='Parcel Building.xlsx', columns=['Parcel Number U', 'Card', 'Year Built', 'Year Effective'])
+cama_tables = morpcParcels.extract_tables_from_cama('./logan_data/cama/PublicRecordsExcel.zip', tables={
+    'Parcel Building.xlsx':['Parcel Number U', 'Card', 'Year Built', 'Year Effective'],
+    'Parcel Dwelling.xlsx':['Parcel Number U', 'Card', 'Year Built', 'Year Effective'],
+})
+build = cama_tables['Parcel Building.xlsx']
 
 # %%
-dwell = morpcParcels.extract_fields_from_cama('./logan_data/cama/PublicRecordsExcel.zip', filename='Parcel Dwelling.xlsx', columns=['Parcel Number U', 'Card', 'Year Built', 'Year Effective'])
+dwell = cama_tables['Parcel Dwelling.xlsx']
 
 # %%
 cama = pd.concat([build, dwell])
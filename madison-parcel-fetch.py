@@ -68,22 +68,32 @@ addr = addr_raw[['LSN', 'geometry']].to_crs('epsg:3735')
 units = parcels.sjoin(addr[['LSN', 'geometry']]).groupby('TAXPIN').agg({'LSN':'count'}).rename(columns={'LSN':'UNITS'})
 
 # %%
-build = morpcParcels.extract_fields_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', filename='Parcel Building.xml', columns=['Parcel_Number', 'Card', 'Year_Built', 'Year_Effective']).set_index('Parcel_Number')
-dwell = morpcParcels.extract_fields_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', filename='Parcel Dwelling.xml', columns=['Parcel_Number', 'Card', 'Year_Built', 'Year_Effective']).set_index('Parcel_Number')
+# Read all of the CAMA tables in one pass over the archive, parsing Parcel Appraisal.xml once for both of its tables
+cama = morpcParcels.extract_tables_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', tables={
+    'build':('Parcel Building.xml', ['Parcel_Number', 'Card', 'Year_Built', 'Year_Effective']),
+    'dwell':('Parcel Dwelling.xml', ['Parcel_Number', 'Card', 'Year_Built', 'Year_Effective']),
+    'land_use':('Parcel Appraisal.xml', ['Parcel_Number', 'Land_Use_Code']),
+    'appr_tot':('Parcel Appraisal.xml', ['Parcel_Number', 'Total_Appraised_Improvement', 'Total_Appraised_Land']),
+    'acres':('Parcel.xml', ['Parcel_Number', 'Acres']),
+})
+
+# %%
+build = cama['build'].set_index('Parcel_Number')
+dwell = cama['dwell'].set_index('Parcel_Number')
 yrbuilt = pd.concat([build, dwell]).dropna()
 yrbuilt['Year_Effective'] = [x if y==None else y for x, y in zip(yrbuilt['Year_Built'], yrbuilt['Year_Effective'])]
 yrbuilt = yrbuilt.groupby('Parcel_Number').agg({'Year_Effective':'max'})
 
 # %%
-land_use = morpcParcels.extract_fields_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', filename='Parcel Appraisal.xml', columns=['Parcel_Number', 'Land_Use_Code']).set_index('Parcel_Number')
+land_use = cama['land_use'].set_index('Parcel_Number')
 
 # %%
-appr_tot = morpcParcels.extract_fields_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', filename='Parcel Appraisal.xml', columns=['Parcel_Number', 'Total_Appraised_Improvement', 'Total_Appraised_Land']).set_index('Parcel_Number')
+appr_tot = cama['appr_tot'].set_index('Parcel_Number')
 appr_tot['APPRTOT'] = [int(x) + int(y) for x, y in zip(appr_tot['Total_Appraised_Improvement'], appr_tot['Total_Appraised_Land'])]
 appr_tot = appr_tot[['APPRTOT']]
 
 # %%
-acres = morpcParcels.extract_fields_from_cama(zip_path='./input_data/madison_data/cama/PublicRecordsExtract.zip', filename='Parcel.xml', columns=['Parcel_Number', 'Acres']).set_index('Parcel_Number')
+acres = cama['acres'].set_index('Parcel_Number')
 
 # %%
 parcels = parcels.join([land_use, yrbuilt, acres, units, appr_tot]).drop_duplicates().reset_index()
@@ -1,109 +1,1881 @@
+import threading
+from collections import deque
+
+# Settings for the shared HTTP transport that every request in this module goes through. Change them with
+# configure_transport().
+TRANSPORT = {
+    # (connect, read) timeouts in seconds
+    'timeout':(10, 120),
+    # How many times to retry a request that fails to connect, times out, or gets one of retry_statuses
+    'retries':5,
+    # Seconds to wait before the first retry, doubled for each retry after that. A Retry-After header wins.
+    'backoff':1.0,
+    'retry_statuses':(429, 500, 502, 503, 504),
+    # Maximum number of keep-alive connections kept open to each host
+    'pool_size':16,
+    # Number of per-request metrics to keep for transport_metrics()
+    'metrics_size':100000,
+    # Limit the number of requests in flight to each host with an AIMD controller (see _HostLimiter). The limit
+    # starts at initial_concurrency and stays between min_concurrency and max_concurrency.
+    'adaptive_concurrency':True,
+    'initial_concurrency':4,
+    'min_concurrency':1,
+    'max_concurrency':32,
+}
+
+# Settings for the on-disk cache of GET responses (feature pages, directory listings, metadata). Change them with
+# configure_http_cache().
+HTTP_CACHE = {
+    'enabled':False,
+    # Directory for the cached responses. None uses ~/.cache/morpcParcels/http (or $XDG_CACHE_HOME).
+    'path':None,
+    # Seconds a cached response is used without asking the server. After that it is revalidated with
+    # If-None-Match/If-Modified-Since, or downloaded again if the server sent neither an ETag nor a Last-Modified.
+    'ttl':0,
+    # Total size of the cached bodies in bytes. The least recently used responses are removed to stay under it.
+    'max_bytes':2 * 1024 ** 3,
+    # Use a cached response, however old, when the server can't be reached or answers with a 5xx status
+    'offline':True,
+}
+
+# Response headers kept with a cached body
+_CACHED_HEADERS = {'content-type', 'content-disposition', 'etag', 'last-modified'}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_http_cache_lock = threading.Lock()
+_http_cache_size = None
+_metrics = deque(maxlen=TRANSPORT['metrics_size'])
+_limiters = {}
+
+# Change the settings of the shared HTTP transport.
+def configure_transport(**settings):
+    """Changes the settings used by http_request() for every request made by this module.
+
+    Example Usage:
+        morpcParcels.configure_transport(timeout=(5, 300), retries=8)
+
+    Parameters:
+    ------------
+    **settings
+        Any of the keys of morpcParcels.TRANSPORT: timeout, retries, backoff, retry_statuses, pool_size,
+        metrics_size, adaptive_concurrency, initial_concurrency, min_concurrency, max_concurrency. Changing
+        pool_size starts new sessions and changing any of the concurrency settings starts new host limiters.
+    """
+    global _metrics
+
+    for key in settings:
+        if key not in TRANSPORT:
+            print(f"{key} is not a transport setting, use one of {list(TRANSPORT)}.")
+            raise RuntimeError
+    TRANSPORT.update(settings)
+    if 'pool_size' in settings:
+        with _sessions_lock:
+            for session in _sessions.values():
+                session.close()
+            _sessions.clear()
+    if 'metrics_size' in settings:
+        _metrics = deque(_metrics, maxlen=TRANSPORT['metrics_size'])
+    if any([key.endswith('concurrency') for key in settings]):
+        with _sessions_lock:
+            _limiters.clear()
+
+# Get the pooled keep-alive session for the host of a url.
+def _session(url):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib.parse import urlsplit
+
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        if host not in _sessions:
+            session = requests.Session()
+            # Retries are handled in http_request() so that every attempt is measured
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TRANSPORT['pool_size'], max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            # urllib3 can only decode brotli if one of the brotli packages is installed
+            encodings = 'gzip, deflate'
+            try:
+                import brotli
+                encodings = 'gzip, deflate, br'
+            except ImportError:
+                try:
+                    import brotlicffi
+                    encodings = 'gzip, deflate, br'
+                except ImportError:
+                    pass
+            session.headers['Accept-Encoding'] = encodings
+            _sessions[host] = session
+        return(_sessions[host])
+
+# Get the concurrency limiter for the host of a url.
+def _limiter(host):
+    with _sessions_lock:
+        if host not in _limiters:
+            _limiters[host] = _HostLimiter(host, TRANSPORT['initial_concurrency'], TRANSPORT['min_concurrency'], TRANSPORT['max_concurrency'])
+        return(_limiters[host])
+
+# Adapt the number of requests in flight to one host to what it tolerates.
+class _HostLimiter:
+    """Additive-increase/multiplicative-decrease limit on the number of concurrent requests to one host.
+
+    Each request waits for a free slot before it is sent. After a successful response the limit grows by 1/limit
+    (about one more slot per round of requests) as long as its latency stayed within latency_factor of the 10th
+    percentile of recent latencies of the same kind of request (see _request_kind()), counted per unit_bytes of
+    response so that bigger pages aren't mistaken for a slower server. A latency must also be min_slow_seconds over
+    the percentile to count, so that jitter on requests that take a few milliseconds is ignored. A 429 or 503 response, a timeout, or a latency
+    above that multiplies the limit by decrease instead, at most once per cooldown so a burst only counts once.
+    """
+
+    def __init__(self, host, initial, minimum, maximum, decrease=0.5, latency_factor=2.0, unit_bytes=256 * 1024, min_slow_seconds=0.1, cooldown=1.0):
+        self.host = host
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.unit_bytes = unit_bytes
+        self.min_slow_seconds = min_slow_seconds
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latencies = {}
+        self.last_decrease = 0
+        self.counters = {'requests':0, 'throttled':0, 'timeouts':0, 'slow':0, 'increases':0, 'decreases':0, 'wait_seconds':0.0, 'peak_limit':float(initial), 'peak_in_flight':0}
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        import time
+        start = time.perf_counter()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self.counters['requests'] += 1
+            self.counters['wait_seconds'] += time.perf_counter() - start
+            self.counters['peak_in_flight'] = max(self.counters['peak_in_flight'], self.in_flight)
+
+    def release(self, status, seconds=None, size=0, kind=None, timed_out=False):
+        """Frees the slot of a request of kind that ended with status (None for a connection error or timeout) after
+        seconds, with a response of size bytes."""
+        import time
+        with self._condition:
+            self.in_flight -= 1
+            throttled = status in (429, 503)
+            slow = False
+            if status != None and status < 400 and seconds != None:
+                # Only compare like with like: count and ID requests are far quicker than pages of features
+                latency = seconds / max(size / self.unit_bytes, 1)
+                latencies = self.latencies.setdefault(kind, deque(maxlen=50))
+                if len(latencies) >= 10:
+                    baseline = sorted(latencies)[len(latencies) // 10]
+                    slow = latency > max(baseline * self.latency_factor, baseline + self.min_slow_seconds)
+                latencies.append(latency)
+            if throttled or timed_out or slow:
+                self.counters['throttled' if throttled else 'timeouts' if timed_out else 'slow'] += 1
+                now = time.monotonic()
+                if now - self.last_decrease > self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease = now
+                    self.counters['decreases'] += 1
+            elif status != None and status < 400:
+                if self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                    self.counters['increases'] += 1
+                    self.counters['peak_limit'] = max(self.counters['peak_limit'], self.limit)
+            self._condition.notify_all()
+
+# Report what the concurrency limiter has learned about each host.
+def host_limits():
+    """Returns one row per host with the current concurrency limit and the counters of its limiter: requests,
+    throttled (429/503 responses), timeouts, slow (responses over the latency threshold), increases, decreases, wait_seconds
+    (total time requests waited for a slot), peak_limit and peak_in_flight.
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+    """
+    import pandas as pd
+
+    with _sessions_lock:
+        rows = [dict({'host':host, 'limit':round(limiter.limit, 2), 'in_flight':limiter.in_flight}, **limiter.counters) for host, limiter in _limiters.items()]
+    return(pd.DataFrame(rows))
+
+# Make an HTTP request through the shared transport.
+def http_request(method, url, params=None, stream=False, cache=None, retry_timeouts=True, **kwargs):
+    """Makes an HTTP request with a pooled keep-alive session for the url's host, compressed responses, the
+    configured timeouts, and retries with exponential backoff on connection errors, timeouts and 429/5xx responses.
+    Every attempt is recorded for transport_metrics(). Unless TRANSPORT['adaptive_concurrency'] is False, each attempt
+    also waits for a slot from the host's concurrency limiter (see host_limits()); streamed responses give the slot
+    back once the headers have arrived. GET requests that aren't streamed can be answered from the HTTP cache (see
+    configure_http_cache()); ArcGIS error bodies ({"error": ...}) are never cached, even with a 200 status.
+
+    Example Usage:
+        r = morpcParcels.http_request('GET', 'https://apps.franklincountyauditor.com/Outside_User_Files/')
+
+    Parameters:
+    ------------
+    method : str
+        'GET', 'HEAD', 'POST', etc.
+
+    url : str
+
+    params : dict
+        Query string parameters.
+
+    stream : boolean
+        If True don't download the body until it is read, as with requests. Streamed responses are never cached.
+
+    cache : boolean
+        Whether to use the HTTP cache for this request. None (the default) follows HTTP_CACHE['enabled'].
+
+    retry_timeouts : boolean
+        If False a timed out attempt is raised at once instead of retried, for callers that would rather ask for less
+        (e.g. a smaller page) than wait out the retries. Connection errors are still retried.
+
+    **kwargs
+        Other keyword arguments, such as headers, are passed to requests.Session.request(). timeout defaults to
+        TRANSPORT['timeout'].
+
+    Returns
+    ----------
+    r : requests.Response
+        The response to the last attempt. Responses with an error status are returned, not raised, once the retries
+        run out. Responses from the HTTP cache have r.from_cache set to True. Other responses have r.attempt_seconds
+        set to how long the last attempt took, without the time spent waiting for a limiter slot or between retries.
+    """
+    import time
+    import requests
+
+    if cache == None:
+        cache = HTTP_CACHE['enabled']
+    headers = {key.lower() for key in (kwargs.get('headers') or {})}
+    # Requests that bring their own conditional or Range headers are the caller's business
+    if not cache or method != 'GET' or stream or headers & {'range', 'if-none-match', 'if-modified-since'}:
+        return(_send(method, url, params, stream, retry_timeouts, **kwargs))
+
+    key = _request_key(url, params)
+    entry = _read_http_cache(key)
+    if entry != None and time.time() - entry['fetched'] < HTTP_CACHE['ttl']:
+        return(_cached_response(key, entry))
+
+    conditional = {}
+    if entry != None and entry.get('etag') != None:
+        conditional['If-None-Match'] = entry['etag']
+    if entry != None and entry.get('last_modified') != None:
+        conditional['If-Modified-Since'] = entry['last_modified']
+    try:
+        r = _send(method, url, params, stream, retry_timeouts, **dict(kwargs, headers=dict(kwargs.get('headers') or {}, **conditional)))
+    except (requests.ConnectionError, requests.Timeout):
+        if entry == None or not HTTP_CACHE['offline']:
+            raise
+        print(f"{url} could not be reached, using the copy cached at {time.ctime(entry['fetched'])}.")
+        return(_cached_response(key, entry))
+
+    if r.status_code == 304 and entry != None:
+        entry = dict(entry, fetched=time.time())
+        _write_http_cache(key, entry)
+        return(_cached_response(key, entry))
+    # ArcGIS reports a failed query as a 200 response with an {"error": ...} body, which mustn't be served again
+    if r.status_code == 200 and not _is_error_body(r.content):
+        _write_http_cache(key, {'url':url, 'params':params, 'fetched':time.time(), 'etag':r.headers.get('ETag'),
+                                'last_modified':r.headers.get('Last-Modified'),
+                                'headers':{name:value for name, value in r.headers.items() if name.lower() in _CACHED_HEADERS}}, r.content)
+    elif r.status_code >= 500 and entry != None and HTTP_CACHE['offline']:
+        print(f"{url} returned {r.status_code}, using the copy cached at {time.ctime(entry['fetched'])}.")
+        return(_cached_response(key, entry))
+    return(r)
+
+# Tell whether a response body is an ArcGIS error ({"error": {"code": ..., "message": ...}}).
+def _is_error_body(content):
+    import re
+    # Only the start of the body is looked at, so large pages of features aren't parsed twice
+    return(re.match(rb'\s*\{\s*"error"\s*:', content[:256]) != None)
+
+# Send a request, retrying connection errors, timeouts and retry_statuses.
+def _send(method, url, params=None, stream=False, retry_timeouts=True, **kwargs):
+    import time
+    import requests
+    from urllib.parse import urlsplit
+
+    kwargs.setdefault('timeout', TRANSPORT['timeout'])
+    session = _session(url)
+    host = urlsplit(url).netloc
+
+    limiter = _limiter(host) if TRANSPORT['adaptive_concurrency'] else None
+
+    attempt = 0
+    while True:
+        if limiter != None:
+            limiter.acquire()
+        start = time.perf_counter()
+        try:
+            r = session.request(method, url, params=params, stream=stream, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if limiter != None:
+                limiter.release(None, timed_out=isinstance(e, requests.Timeout))
+            _record_metric(method, host, url, None, time.perf_counter() - start, 0, attempt, type(e).__name__)
+            if attempt >= TRANSPORT['retries'] or (isinstance(e, requests.Timeout) and not retry_timeouts):
+                raise
+            time.sleep(TRANSPORT['backoff'] * 2 ** attempt)
+            attempt += 1
+            continue
+
+        # Without stream the body has been downloaded, so its (decoded) size is known
+        size = len(r.content) if not stream else int(r.headers.get('Content-Length') or 0)
+        seconds = time.perf_counter() - start
+        r.attempt_seconds = seconds
+        if limiter != None:
+            limiter.release(r.status_code, seconds, size, _request_kind(url, params, stream))
+        _record_metric(method, host, url, r.status_code, seconds, size, attempt, None)
+        if r.status_code not in TRANSPORT['retry_statuses'] or attempt >= TRANSPORT['retries']:
+            return(r)
+
+        wait = TRANSPORT['backoff'] * 2 ** attempt
+        retry_after = r.headers.get('Retry-After')
+        if retry_after != None and retry_after.isdigit():
+            wait = int(retry_after)
+        r.close()
+        time.sleep(wait)
+        attempt += 1
+
+# Classify a request for the latency baselines of _HostLimiter.
+def _request_kind(url, params=None, stream=False):
+    from urllib.parse import urlsplit
+
+    params = params or {}
+    if stream:
+        return('stream')
+    if str(params.get('returnCountOnly')).lower() == 'true' or str(params.get('returnIdsOnly')).lower() == 'true' or 'outStatistics' in params:
+        return('count')
+    if urlsplit(url).path.rstrip('/').endswith('/query'):
+        return('page')
+    return('metadata')
+
+# Make a GET request through the shared transport.
+def http_get(url, params=None, stream=False, cache=None, retry_timeouts=True, **kwargs):
+    """Shortcut for http_request('GET', ...)."""
+    return(http_request('GET', url, params=params, stream=stream, cache=cache, retry_timeouts=retry_timeouts, **kwargs))
+
+def _record_metric(method, host, url, status, seconds, size, attempt, error):
+    import time
+    _metrics.append({'time':time.time(), 'method':method, 'host':host, 'url':url, 'status':status,
+                     'seconds':seconds, 'bytes':size, 'attempt':attempt, 'error':error})
+
+# Summarize the requests made through the shared transport.
+def transport_metrics(by_host=False, reset=False):
+    """Returns the metrics recorded for each request attempt made by this module: time, method, host, url, status,
+    seconds, bytes (the decoded body size, or the Content-Length of streamed responses), attempt (0 for the first
+    try) and error.
+
+    Parameters:
+    ------------
+    by_host : boolean
+        If True return one row per host with the number of requests, retries, errors, total bytes and mean and
+        maximum seconds.
+
+    reset : boolean
+        If True clear the recorded metrics after reading them.
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(list(_metrics), columns=['time', 'method', 'host', 'url', 'status', 'seconds', 'bytes', 'attempt', 'error'])
+    if reset:
+        _metrics.clear()
+    if by_host:
+        df = df.groupby('host').agg(
+            requests=('url', 'count'),
+            retries=('attempt', lambda x: int((x > 0).sum())),
+            errors=('error', 'count'),
+            bytes=('bytes', 'sum'),
+            mean_seconds=('seconds', 'mean'),
+            max_seconds=('seconds', 'max'),
+        ).reset_index()
+    return(df)
+
+# Change the settings of the HTTP cache.
+def configure_http_cache(**settings):
+    """Changes the settings of the on-disk cache of GET responses used by http_request(). The cache is off until it
+    is enabled. With it on, reruns send conditional requests and reuse the cached body when the server answers
+    304 Not Modified, reuse everything younger than ttl seconds without a request, and fall back to the cached copy
+    when the server is unreachable.
+
+    Example Usage:
+        morpcParcels.configure_http_cache(enabled=True, ttl=12*3600, max_bytes=5*1024**3)
+
+    Parameters:
+    ------------
+    **settings
+        Any of the keys of morpcParcels.HTTP_CACHE: enabled, path, ttl, max_bytes, offline.
+    """
+    global _http_cache_size
+
+    for key in settings:
+        if key not in HTTP_CACHE:
+            print(f"{key} is not an HTTP cache setting, use one of {list(HTTP_CACHE)}.")
+            raise RuntimeError
+    HTTP_CACHE.update(settings)
+    with _http_cache_lock:
+        # Recount the cache size for a new path or limit
+        _http_cache_size = None
+    if 'max_bytes' in settings:
+        _evict_http_cache()
+
+# Remove everything from the HTTP cache.
+def clear_http_cache():
+    """Deletes every cached response."""
+    import shutil
+    global _http_cache_size
+
+    with _http_cache_lock:
+        shutil.rmtree(_http_cache_dir(), ignore_errors=True)
+        _http_cache_size = None
+
+def _default_cache_dir(name):
+    import os
+
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return(os.path.join(root, 'morpcParcels', name))
+
+def _http_cache_dir():
+    return(HTTP_CACHE['path'] if HTTP_CACHE['path'] != None else _default_cache_dir('http'))
+
+# Read the description of a cached response, marking it as recently used.
+def _read_http_cache(key):
+    import os
+    import json
+
+    path = os.path.join(_http_cache_dir(), f"{key}.json")
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        # The modification time of the description is the last use that LRU eviction goes by
+        os.utime(path)
+    except (OSError, ValueError):
+        return(None)
+    if not os.path.exists(os.path.join(_http_cache_dir(), f"{key}.body")):
+        return(None)
+    return(entry)
+
+# Store a response body and its description, or only update the description if content is None.
+def _write_http_cache(key, entry, content=None):
+    import os
+    import json
+    global _http_cache_size
+
+    cache_dir = _http_cache_dir()
+    path = os.path.join(cache_dir, key)
+    part = f".{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if content != None:
+            # Write under temporary names first so that other processes never read a partial response
+            old_size = os.path.getsize(f"{path}.body") if os.path.exists(f"{path}.body") else 0
+            with open(f"{path}.body{part}", 'wb') as f:
+                f.write(content)
+            os.replace(f"{path}.body{part}", f"{path}.body")
+            entry = dict(entry, size=len(content))
+        with open(f"{path}.json{part}", 'w') as f:
+            json.dump(entry, f, default=str)
+        os.replace(f"{path}.json{part}", f"{path}.json")
+    except OSError:
+        # The cache is only an optimization, so an unwritable cache directory just means no caching
+        return
+    if content != None:
+        with _http_cache_lock:
+            if _http_cache_size != None:
+                _http_cache_size += len(content) - old_size
+        _evict_http_cache()
+
+# Remove the least recently used responses until the cache is under HTTP_CACHE['max_bytes'].
+def _evict_http_cache():
+    import os
+    global _http_cache_size
+
+    cache_dir = _http_cache_dir()
+    with _http_cache_lock:
+        if _http_cache_size != None and _http_cache_size <= HTTP_CACHE['max_bytes']:
+            return
+        entries = []
+        try:
+            names = os.listdir(cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                used = os.path.getmtime(os.path.join(cache_dir, name))
+                size = os.path.getsize(os.path.join(cache_dir, f"{key}.body"))
+            except OSError:
+                continue
+            entries.append((used, key, size))
+        _http_cache_size = sum([size for used, key, size in entries])
+        for used, key, size in sorted(entries):
+            if _http_cache_size <= HTTP_CACHE['max_bytes']:
+                break
+            for suffix in ('.json', '.body'):
+                try:
+                    os.remove(os.path.join(cache_dir, f"{key}{suffix}"))
+                except OSError:
+                    pass
+            _http_cache_size -= size
+
+# Build a requests.Response from a cached response.
+def _cached_response(key, entry):
+    import os
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    with open(os.path.join(_http_cache_dir(), f"{key}.body"), 'rb') as f:
+        content = f.read()
+    r = requests.Response()
+    r.status_code = 200
+    r.reason = 'OK'
+    r.url = entry['url']
+    r.headers = CaseInsensitiveDict(entry.get('headers') or {})
+    r._content = content
+    r._content_consumed = True
+    r.from_cache = True
+    return(r)
+
+# Settings for the cache of layer metadata (the ?f=pjson description) and record counts. Change them with
+# configure_metadata_cache().
+METADATA_CACHE = {
+    'enabled':True,
+    # Directory for the cache files. None uses ~/.cache/morpcParcels/metadata (or $XDG_CACHE_HOME).
+    'path':None,
+    # Seconds a cached layer description is used without asking the server. After that it is revalidated with
+    # If-None-Match/If-Modified-Since when the server sent an ETag or Last-Modified header.
+    'ttl':3600,
+    # Seconds a cached record count is used. Records added after the count was cached are missed by offset
+    # pagination, so keep this short, or 0 to always ask the server.
+    'count_ttl':300,
+}
+
+_metadata_memory = {}
+_metadata_lock = threading.Lock()
+
+# Change the settings of the metadata cache.
+def configure_metadata_cache(**settings):
+    """Changes the settings used by the layer metadata and record count cache.
+
+    Example Usage:
+        morpcParcels.configure_metadata_cache(ttl=24*3600, path='./temp_data/metadata/')
+
+    Parameters:
+    ------------
+    **settings
+        Any of the keys of morpcParcels.METADATA_CACHE: enabled, path, ttl, count_ttl.
+    """
+    for key in settings:
+        if key not in METADATA_CACHE:
+            print(f"{key} is not a metadata cache setting, use one of {list(METADATA_CACHE)}.")
+            raise RuntimeError
+    METADATA_CACHE.update(settings)
+    if 'path' in settings:
+        with _metadata_lock:
+            _metadata_memory.clear()
+
+# Remove everything from the metadata cache.
+def clear_metadata_cache():
+    """Forgets all cached layer descriptions and record counts, in memory and on disk."""
+    import shutil
+
+    with _metadata_lock:
+        _metadata_memory.clear()
+    shutil.rmtree(_metadata_cache_dir(), ignore_errors=True)
+
+def _metadata_cache_dir():
+    return(METADATA_CACHE['path'] if METADATA_CACHE['path'] != None else _default_cache_dir('metadata'))
+
+# Read a metadata cache entry from memory, or from disk.
+def _read_metadata_entry(key):
+    import os
+    import json
+
+    with _metadata_lock:
+        if key in _metadata_memory:
+            return(_metadata_memory[key])
+    path = os.path.join(_metadata_cache_dir(), f"{key}.json")
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return(None)
+    with _metadata_lock:
+        _metadata_memory[key] = entry
+    return(entry)
+
+# Write a metadata cache entry to memory and to disk.
+def _write_metadata_entry(key, entry):
+    import os
+    import json
+
+    with _metadata_lock:
+        _metadata_memory[key] = entry
+    cache_dir = _metadata_cache_dir()
+    path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write under a temporary name first so that other processes never read a partial entry
+        with open(f"{path}.{os.getpid()}.part", 'w') as f:
+            json.dump(entry, f)
+        os.replace(f"{path}.{os.getpid()}.part", path)
+    except OSError:
+        # The cache is only an optimization, so an unwritable cache directory leaves just the in-memory copy
+        pass
+
 # Create a GeoDataFrame object from an ArcGIS service feature layer filtered by column names. 
-def gdf_from_services(url, fieldIds = None, crs='from_service'):
+def gdf_from_services(url, fieldIds = None, crs='from_service', sync_path=None, **kwargs):
     """Creates a GeoDataFrame from a request to an ArcGIS Services. Automatically queries for maxRecordCount and iterates
     over the whole feature layer to return all features. Optional: Filter the results by including a list of field IDs.
 
     Example Usage:
+        parcels = morpcParcels.gdf_from_services(parcel_url, fieldIds=['PARCELID', 'CLASSCD'], max_workers=4)
+
+    Parameters:
+    ------------
+    url : str
+        A path to a ArcGIS Service feature layer. 
+        Example: https://services2.arcgis.com/ziXVKVy3BiopMCCU/arcgis/rest/services/Parcel/FeatureServer/0
+
+    fieldIds : list of str
+        A list of strings that match field ids in the feature layer.
+
+    crs : 'from_service', None, or str to pass to gpd.GeoDataframe.set_crs()
+
+    sync_path : str
+        If given, keep a local copy of the layer at this path (".parquet" or ".gpkg") and only download the features
+        that were added, edited or deleted since the last call. See sync_service_layer().
+
+    **kwargs
+        Other keyword arguments, such as max_workers, are passed to iter_service_pages().
+
+    Returns
+    ----------
+    gdf : pandas.core.frame.DataFrame
+        A GeoPandas GeoDataframe constructed from the GeoJSON requested from the url.
+    """
+
+    if sync_path != None:
+        return(sync_service_layer(url, sync_path, fieldIds=fieldIds, crs=crs, **kwargs))
+
+    # Collect the pages and build the GeoDataFrame once at the end instead of concatenating after every page
+    accumulator = PageAccumulator()
+    for page in iter_service_pages(url, fieldIds=fieldIds, crs=crs, **kwargs):
+        accumulator.add(page)
+        
+    gdf = accumulator.to_gdf()
+        
+    return(gdf)
+
+# Iterate over an ArcGIS service feature layer one page at a time.
+def iter_service_pages(url, fieldIds = None, crs='from_service', max_workers=1, as_arrow=False, pagination='offset', objectIds=None, f='geojson', decoder='auto',
+                       geometryPrecision=None, maxAllowableOffset=None, returnZ=False, returnM=False, checkpoint_dir=None,
+                       page_size=None, where='1=1', geometry=None, spatialRel='esriSpatialRelIntersects', inSR=None, returnGeometry=True):
+    """Yields the features of an ArcGIS Service feature layer one page (by default maxRecordCount records) at a time,
+    so that a whole layer never has to be held in memory. Takes the same query options as gdf_from_services().
+
+    Example Usage:
+        for page in morpcParcels.iter_service_pages(parcel_url, fieldIds=['PARCELID']):
+            page.to_file('./input_data/parcels.gpkg', mode='a')
+
+    Parameters:
+    ------------
+    url : str
+        A path to a ArcGIS Service feature layer. 
+
+    fieldIds : list of str
+        A list of strings that match field ids in the feature layer.
+
+    crs : 'from_service', None, or str to pass to gpd.GeoDataframe.set_crs()
+
+    max_workers : int
+        The maximum number of page requests to have in flight at once. The default of 1 downloads one page at a time.
+        Pages are always yielded in offset order, so the result is the same as the serial download.
+
+    as_arrow : boolean
+        If True yield each page as a pyarrow.Table (geometry encoded as WKB) instead of a GeoDataFrame.
+
+    pagination : 'offset', 'objectids' or 'tiles'
+        How to split the layer into pages. 'offset' pages with resultOffset and works on any service that supports
+        pagination. 'objectids' requests the sorted object IDs once (returnIdsOnly=true) and then requests each page
+        as a window of object IDs, so every request costs the same no matter how deep into the layer it is and rows
+        cannot be skipped or repeated between pages. 'tiles' is for services where paging is slow, capped or wrong
+        (some MapServer layers): the layer extent is split into envelope tiles, any tile holding more features than
+        fit in one response is split into four, and features that straddle tiles are kept once by object ID. With
+        'tiles' pages are yielded in the order the tiles finish.
+
+    objectIds : list of int
+        If given, only request the features with these object IDs, in batches passed with the objectIds parameter.
+
+    f : 'geojson' or 'json'
+        The response format to request. Use 'json' (Esri JSON) for services that do not support GeoJSON output; the
+        pages are decoded with esri_json_to_geoseries().
+
+    decoder : 'auto', 'pyogrio' or 'features'
+        How GeoJSON pages are decoded. 'pyogrio' hands the raw response bytes to GDAL, which builds the columns
+        without a Python dict or shapely object per feature. 'features' parses the JSON and uses
+        gpd.GeoDataFrame.from_features(). 'auto' uses pyogrio when it is installed and falls back to 'features' if
+        pyogrio is missing or cannot read a page.
+
+    geometryPrecision : int
+        The number of decimal places the server should round coordinates to. In a projected crs such as Ohio State
+        Plane (feet), 0 or 1 is plenty for countywide analysis and cuts the size of polygon pages considerably.
+
+    maxAllowableOffset : float
+        Let the server generalize geometries so that they stay within this distance (in the layer's units) of the
+        originals.
+
+    returnZ, returnM : boolean
+        Whether the server should include z and m values. Both are left out by default since nothing here uses them.
+
+    checkpoint_dir : str
+        If given, save the raw response for every completed page in a spool folder under checkpoint_dir, keyed by the
+        service url, the query and the page window. If the download fails part way, running the same call again reads
+        the pages that already finished from the spool and only requests the missing ones. The spool folder is
+        removed once every page has been read. Resuming relies on the page windows being the same as in the first
+        run, so use a fixed page_size with checkpoints. With pagination='tiles' each tile's page is keyed by the tile's
+        envelope; the tiles are counted again on resume, but only the ones without a checkpoint are downloaded.
+
+    page_size : None, int or 'auto'
+        The number of records to request per page. None uses the layer's maxRecordCount. 'auto' starts at up to 1000
+        records and tunes the page size as it goes: pages grow while responses are quick and small and shrink when
+        they are slow or large, when a request times out, or when the server returns fewer records than asked for
+        (exceededTransferLimit). Truncated or timed out pages are always completed by requesting the rest again in
+        smaller pieces; a timed out page is split at once rather than retried at the same size.
+
+    where : str
+        A SQL where clause the server filters the features with, e.g. "CLASSCD LIKE '5%'". Features that don't match
+        are never transferred.
+
+    geometry : tuple of (xmin, ymin, xmax, ymax) or shapely geometry
+        Only request features with this spatial relationship (spatialRel) to the geometry. An envelope tuple is sent
+        as esriGeometryEnvelope; shapely points, lines and polygons are converted to Esri JSON.
+
+    spatialRel : str
+        The ArcGIS spatial relationship to use with geometry, e.g. esriSpatialRelIntersects or esriSpatialRelContains.
+
+    inSR : int or str
+        The wkid of the geometry's coordinates. Defaults to the layer's spatial reference.
+
+    returnGeometry : boolean
+        If False the server leaves out the geometries, and pages are plain pandas DataFrames of attributes. Use for
+        attribute-only (CAMA-style) pulls.
+
+    Yields
+    ----------
+    page : geopandas.GeoDataFrame, pandas.DataFrame or pyarrow.Table
+        One page of features.
+    """
+
+    import os
+    import shutil
+    import requests
+    import pandas as pd
+    from IPython.display import clear_output
+
+    #Construct url to query for getting total count and geojson
+    query_url = f"{url}/query"
+    params = {'outFields':'*', 'where':'1=1', 'f':f}
+
+    # Request JSON and find maxRecordCount
+    result = _service_metadata(url)
+    maxRecordCount = result['maxRecordCount']
+    
+    if crs == 'from_service':
+        crs = result['extent']['spatialReference']['latestWkid']
+        
+    avail_fields = [dict['name'] for dict in result['fields']]
+
+    if fieldIds != None:
+        if not set(fieldIds).issubset(avail_fields):
+            print(f"{fieldIds} not in available fields.")
+            raise RuntimeError
+        else:
+            params['outFields'] = ",".join(fieldIds)
+
+    # Filter on the server, so that the count, object ID and page requests below all see only the matching features
+    params['where'] = where
+    if geometry != None:
+        params['geometryType'], params['geometry'] = _esri_geometry_param(geometry)
+        params['spatialRel'] = spatialRel
+        params['inSR'] = inSR or result['extent']['spatialReference'].get('latestWkid', result['extent']['spatialReference'].get('wkid'))
+        if pagination == 'tiles' and (params['geometryType'] != 'esriGeometryEnvelope' or spatialRel != 'esriSpatialRelIntersects'):
+            print("pagination='tiles' only supports an envelope geometry with esriSpatialRelIntersects.")
+            raise RuntimeError
+
+    # Ask the server to send fewer bytes per feature. These only change the feature pages, so they are added after
+    # params is used for the count and object ID requests below.
+    transfer_params = {'returnZ':str(returnZ).lower(), 'returnM':str(returnM).lower(), 'returnGeometry':str(returnGeometry).lower()}
+    if geometryPrecision != None:
+        transfer_params['geometryPrecision'] = geometryPrecision
+    if maxAllowableOffset != None:
+        transfer_params['maxAllowableOffset'] = maxAllowableOffset
+
+    if page_size == 'auto':
+        controller = _PageSizeController(initial=min(maxRecordCount, 1000), minimum=min(100, maxRecordCount), maximum=maxRecordCount)
+    else:
+        controller = _PageSizeController(initial=page_size or maxRecordCount, minimum=1, maximum=page_size or maxRecordCount, adaptive=False)
+
+    # Plan the page windows lazily, so that each window uses the page size the controller has settled on by the time
+    # it is requested
+    oid_field = None
+    if objectIds != None:
+        # Request only the given object IDs. The IDs are passed in the query string, so keep the batches short.
+        object_ids = sorted(objectIds)
+        totalRecordCount = len(object_ids)
+        controller.maximum = min(controller.maximum, 250)
+        controller.size = min(controller.size, 250)
+        windows = _plan_id_windows(object_ids, controller, 'list')
+    elif pagination == 'offset':
+        # Request the total record count from the API
+        totalRecordCount = _service_count(query_url, params)
+        windows = _plan_offset_windows(totalRecordCount, controller)
+    elif pagination == 'objectids':
+        # Request all of the object IDs and split them into windows of IDs. Since the IDs are sorted, each window
+        # holds exactly the features with IDs between its first and last ID.
+        oid_field, object_ids = _service_object_ids(url, params['where'], _spatial_filter(params))
+        totalRecordCount = len(object_ids)
+        windows = _plan_id_windows(object_ids, controller, 'range')
+    elif pagination == 'tiles':
+        # The object IDs are needed to drop the features that are returned by more than one tile
+        oid_field = _object_id_field(result)
+        drop_oid = params['outFields'] != '*' and oid_field not in params['outFields'].split(',')
+        if drop_oid:
+            params['outFields'] = f"{params['outFields']},{oid_field}"
+        totalRecordCount = _service_count(query_url, dict(params, f='json'))
+    else:
+        print(f"{pagination} is not a pagination strategy, use 'offset', 'objectids' or 'tiles'.")
+        raise RuntimeError
+
+    page_params = dict(params, **transfer_params)
+    print(f"{query_url}?{requests.compat.urlencode(page_params)}")
+
+    spool_dir = None
+    if checkpoint_dir != None:
+        # One spool folder per layer and query, one file per page window
+        spool_dir = os.path.join(checkpoint_dir, _request_key(query_url, dict(params, **transfer_params)))
+        if os.path.exists(spool_dir):
+            print(f"Resuming from checkpoints in {spool_dir}")
+        else:
+            os.makedirs(spool_dir)
+
+    if pagination == 'tiles' and objectIds == None:
+        extent = result['extent']
+        if geometry != None:
+            # Only tile the requested envelope
+            xmin, ymin, xmax, ymax = [float(x) for x in params['geometry'].split(',')]
+            extent = {'xmin':xmin, 'ymin':ymin, 'xmax':xmax, 'ymax':ymax, 'spatialReference':{'wkid':params['inSR']}}
+        pages = _iter_tile_pages(query_url, page_params, extent, totalRecordCount, controller.maximum, crs, decoder, max_workers, spool_dir=spool_dir)
+    else:
+        # With max_workers > 1 several pages are requested at once, but they are still returned in order.
+        fetch = lambda window: _fetch_window(query_url, page_params, window, totalRecordCount, oid_field, controller, crs, decoder, spool_dir)
+        pages = _map_in_order(fetch, windows, max_workers)
+    seen_ids = set()
+    record_count = 0
+    for page in pages:
+        if pagination == 'tiles' and objectIds == None:
+            # Keep each feature once, no matter how many tiles it touches
+            page = page.loc[~page[oid_field].isin(seen_ids)].reset_index(drop=True)
+            seen_ids.update(page[oid_field])
+            if drop_oid:
+                page = page.drop(columns=oid_field)
+        if not returnGeometry:
+            page = pd.DataFrame(page.drop(columns='geometry', errors='ignore'))
+        record_count += len(page)
+        print(f"{record_count} of {totalRecordCount}")
+        clear_output(wait = True)
+
+        if as_arrow:
+            import pyarrow as pa
+            if returnGeometry:
+                page = pa.table(page.to_arrow(geometry_encoding='WKB'))
+            else:
+                page = pa.Table.from_pandas(page, preserve_index=False)
+        yield page
+
+    # Every page has been read, so the checkpoints are no longer needed
+    if spool_dir != None:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+# Request the JSON description of an ArcGIS service feature layer, or take it from the metadata cache.
+def _service_metadata(url, refresh=False):
+    """Returns the layer JSON (fields, maxRecordCount, extent, etc.) of an ArcGIS Service feature layer. Descriptions
+    younger than METADATA_CACHE['ttl'] seconds come from the cache without a request. Older ones are revalidated with a
+    conditional request when the server sent an ETag or Last-Modified header, so an unchanged layer costs a 304
+    response. Error responses are never cached. refresh=True ignores the cached copy.
+    """
+    import time
+
+    if not METADATA_CACHE['enabled']:
+        return(http_get(f"{url}/?f=pjson").json())
+
+    key = _request_key(url)
+    entry = None if refresh else _read_metadata_entry(key)
+    if entry != None and time.time() - entry['fetched'] < METADATA_CACHE['ttl']:
+        return(entry['json'])
+
+    headers = {}
+    if entry != None and entry.get('etag') != None:
+        headers['If-None-Match'] = entry['etag']
+    if entry != None and entry.get('last_modified') != None:
+        headers['If-Modified-Since'] = entry['last_modified']
+    r = http_get(f"{url}/?f=pjson", headers=headers)
+    if r.status_code == 304 and entry != None:
+        entry = dict(entry, fetched=time.time())
+        _write_metadata_entry(key, entry)
+        return(entry['json'])
+
+    result = r.json()
+    if r.status_code == 200 and 'error' not in result:
+        _write_metadata_entry(key, {'url':url, 'fetched':time.time(), 'etag':r.headers.get('ETag'),
+                                    'last_modified':r.headers.get('Last-Modified'), 'json':result})
+    return(result)
+
+# Request the number of records a query selects, or take it from the metadata cache.
+def _service_count(query_url, params, cache=True):
+    """Returns the record count of a returnCountOnly query with params, which works with both f=json ({"count": n})
+    and f=geojson ({"properties": {"count": n}}) responses. With cache=True a count younger than
+    METADATA_CACHE['count_ttl'] seconds is reused.
+    """
+    import re
+    import time
+
+    count_params = dict(params, returnCountOnly='true')
+    cache = cache and METADATA_CACHE['enabled'] and METADATA_CACHE['count_ttl'] > 0
+    key = _request_key(query_url, count_params)
+    if cache:
+        entry = _read_metadata_entry(key)
+        if entry != None and time.time() - entry['fetched'] < METADATA_CACHE['count_ttl']:
+            return(entry['count'])
+
+    r = http_get(query_url, params=count_params)
+    result = r.json()
+    if 'error' in result:
+        print(f"The count request to {query_url} failed: {result['error']}")
+        raise RuntimeError
+    if 'count' in result:
+        count = int(result['count'])
+    elif 'count' in (result.get('properties') or {}):
+        count = int(result['properties']['count'])
+    else:
+        # Some servers put the count somewhere else, so fall back to the first number in the response
+        numbers = re.findall('[0-9]+', r.text)
+        if len(numbers) == 0:
+            print(f"The count request to {query_url} did not return a count: {r.text[:200]}")
+            raise RuntimeError
+        count = int(numbers[0])
+
+    if cache:
+        _write_metadata_entry(key, {'url':query_url, 'fetched':time.time(), 'count':count})
+    return(count)
+
+# Build the geometry and geometryType query parameters for a spatial filter.
+def _esri_geometry_param(geometry):
+    """Returns (geometryType, geometry) query parameter values for an (xmin, ymin, xmax, ymax) tuple or a shapely
+    Point, MultiPoint, LineString, MultiLineString, Polygon or MultiPolygon."""
+    import json
+
+    if isinstance(geometry, (tuple, list)):
+        return('esriGeometryEnvelope', ",".join([str(x) for x in geometry]))
+
+    geom_type = geometry.geom_type
+    if geom_type == 'Point':
+        return('esriGeometryPoint', json.dumps({'x':geometry.x, 'y':geometry.y}))
+    if geom_type == 'MultiPoint':
+        return('esriGeometryMultipoint', json.dumps({'points':[[p.x, p.y] for p in geometry.geoms]}))
+    if geom_type in ('LineString', 'MultiLineString'):
+        lines = [geometry] if geom_type == 'LineString' else list(geometry.geoms)
+        return('esriGeometryPolyline', json.dumps({'paths':[[list(c[:2]) for c in line.coords] for line in lines]}))
+    if geom_type in ('Polygon', 'MultiPolygon'):
+        import shapely
+        # Esri wants exterior rings clockwise and holes counterclockwise, the opposite of shapely.orient_polygons
+        polygons = [geometry] if geom_type == 'Polygon' else list(geometry.geoms)
+        rings = []
+        for polygon in polygons:
+            polygon = shapely.geometry.polygon.orient(polygon, sign=-1.0)
+            rings.append([list(c[:2]) for c in polygon.exterior.coords])
+            rings.extend([[list(c[:2]) for c in interior.coords] for interior in polygon.interiors])
+        return('esriGeometryPolygon', json.dumps({'rings':rings}))
+    print(f"{geom_type} geometries can't be used as a filter.")
+    raise RuntimeError
+
+# Pick out the spatial filter parameters of a query.
+def _spatial_filter(params):
+    return({key:params[key] for key in ['geometry', 'geometryType', 'spatialRel', 'inSR'] if key in params})
+
+# Find the name of the object ID field in the JSON description of a layer.
+def _object_id_field(result):
+    oid_field = result.get('objectIdField')
+    if oid_field == None:
+        oid_field = [field['name'] for field in result['fields'] if field['type'] == 'esriFieldTypeOID'][0]
+    return(oid_field)
+
+# Download a layer tile by tile for iter_service_pages(pagination='tiles').
+def _iter_tile_pages(query_url, params, extent, totalRecordCount, limit, crs=None, decoder='auto', max_workers=1, max_depth=12, spool_dir=None):
+    """Yields a page of features for every envelope tile of the layer extent as the tiles finish. The extent starts
+    as a grid with about one tile per limit features. A tile that holds more than limit features is split into four,
+    down to max_depth splits, below which its features are requested by object ID instead. Features that straddle
+    tiles are yielded more than once, so the caller has to drop duplicates. With spool_dir every page is checkpointed
+    there, keyed by its tile's envelope (see _fetch_page()).
+    """
+    import math
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    inSR = extent['spatialReference'].get('latestWkid', extent['spatialReference'].get('wkid'))
+    side = max(1, math.ceil(math.sqrt(totalRecordCount / limit)))
+    width = (extent['xmax'] - extent['xmin']) / side
+    height = (extent['ymax'] - extent['ymin']) / side
+    tiles = []
+    for i in range(side):
+        for j in range(side):
+            tiles.append((extent['xmin'] + i * width, extent['ymin'] + j * height, extent['xmin'] + (i + 1) * width, extent['ymin'] + (j + 1) * height))
+
+    with ThreadPoolExecutor(max_workers=max(max_workers or 1, 1)) as executor:
+        pending = {executor.submit(_fetch_tile, query_url, params, tile, inSR, limit, 0, max_depth, crs, decoder, spool_dir) for tile in tiles}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page, children, depth = future.result()
+                    for child in children:
+                        pending.add(executor.submit(_fetch_tile, query_url, params, child, inSR, limit, depth + 1, max_depth, crs, decoder, spool_dir))
+                    if page is not None and len(page) > 0:
+                        yield page
+        finally:
+            for future in pending:
+                future.cancel()
+
+# Request the features in one envelope tile, or split it if it holds too many.
+def _fetch_tile(query_url, params, tile, inSR, limit, depth, max_depth, crs=None, decoder='auto', spool_dir=None):
+    """Returns (page, child tiles, depth) for one tile: the tile's features and no children, or no page and the four
+    quarters of the tile if it holds more than limit features."""
+    import pandas as pd
+
+    xmin, ymin, xmax, ymax = tile
+    tile_params = dict(params, geometry=f"{xmin},{ymin},{xmax},{ymax}", geometryType='esriGeometryEnvelope', inSR=inSR, spatialRel='esriSpatialRelIntersects')
+
+    count = _service_count(query_url, dict(tile_params, f='json'), cache=False)
+    if count == 0:
+        return(None, [], depth)
+
+    if count <= limit:
+        page = _fetch_page(query_url, tile_params, crs, decoder, spool_dir)
+        if len(page) >= count:
+            return(page, [], depth)
+        # The server sent fewer than it counted, so its real limit is lower than limit
+
+    if depth < max_depth:
+        xmid = (xmin + xmax) / 2
+        ymid = (ymin + ymax) / 2
+        return(None, [(xmin, ymin, xmid, ymid), (xmid, ymin, xmax, ymid), (xmin, ymid, xmid, ymax), (xmid, ymid, xmax, ymax)], depth)
+
+    # Too many features in too small an area (e.g. stacked condo parcels), so request them by object ID
+    r = http_get(query_url, params=dict(tile_params, returnIdsOnly='true', f='json'))
+    object_ids = sorted(r.json()['objectIds'] or [])
+    parts = []
+    for i in range(0, len(object_ids), 250):
+        parts.append(_fetch_page(query_url, dict(params, objectIds=",".join([str(x) for x in object_ids[i:i + 250]])), crs, decoder, spool_dir))
+    return(pd.concat(parts, axis='index', ignore_index=True), [], depth)
+
+# Keep a local copy of an ArcGIS service feature layer up to date by downloading only what changed.
+def sync_service_layer(url, store_path, fieldIds = None, crs='from_service', editDateField='from_service', lookback_minutes=60, **kwargs):
+    """Incrementally synchronizes a local copy of an ArcGIS Service feature layer and returns it as a GeoDataFrame.
+
+    The first call downloads the whole layer and saves it to store_path along with a small state file
+    (store_path + ".sync.json"). Later calls compare the object IDs on the server with the stored ones to find inserts
+    and deletes, query the edit date field for features edited since the last sync, download only the inserted and
+    edited features, and merge them into the stored copy. If the layer has no edit date field only inserts and deletes
+    are picked up. Changing url, fieldIds, where or the spatial filter starts over with a full download.
+
+    Example Usage:
+        parcels = morpcParcels.sync_service_layer(parcel_url, './input_data/logan_data/parcels/logan_parcels.parquet')
+
+    Parameters:
+    ------------
+    url : str
+        A path to a ArcGIS Service feature layer. 
+
+    store_path : str
+        Where to keep the local copy. Paths ending in ".parquet" are stored as GeoParquet, anything else is written
+        with pyogrio and should be a single-file format such as ".gpkg".
+
+    fieldIds : list of str
+        A list of strings that match field ids in the feature layer. The object ID field is always included.
+
+    crs : 'from_service', None, or str to pass to gpd.GeoDataframe.set_crs()
+
+    editDateField : 'from_service', None, or str
+        The field holding the last edit date. 'from_service' uses the layer's editFieldsInfo. None only syncs inserts
+        and deletes.
+
+    lookback_minutes : int
+        How far before the last sync to look for edits, to allow for clock differences between this machine and the
+        server. Features edited in that window are downloaded again, which is harmless. The last sync time is converted
+        to the time zone of the layer's date fields (dateFieldsTimeReference); if the layer doesn't report one, 14 more
+        hours are added to the lookback.
+
+    **kwargs
+        Other keyword arguments, such as max_workers, are passed to iter_service_pages().
+
+    Returns
+    ----------
+    gdf : geopandas.GeoDataFrame
+        The synchronized layer.
+    """
+    import os
+    import json
+    import datetime
+    import geopandas as gpd
+    import pandas as pd
+
+    state_path = f"{store_path}.sync.json"
+    sync_started = datetime.datetime.now(datetime.timezone.utc)
+
+    result = _service_metadata(url)
+    oid_field = _object_id_field(result)
+    if editDateField == 'from_service':
+        editDateField = (result.get('editFieldsInfo') or {}).get('editDateField')
+    if fieldIds != None and oid_field not in fieldIds:
+        fieldIds = list(fieldIds) + [oid_field]
+
+    # The same spatial filter parameters that iter_service_pages() sends, so the object ID diff sees the same features
+    spatial = {}
+    if kwargs.get('geometry') != None:
+        spatial['geometryType'], spatial['geometry'] = _esri_geometry_param(kwargs['geometry'])
+        spatial['spatialRel'] = kwargs.get('spatialRel', 'esriSpatialRelIntersects')
+        spatial['inSR'] = kwargs.get('inSR') or result['extent']['spatialReference'].get('latestWkid', result['extent']['spatialReference'].get('wkid'))
+
+    state = None
+    if os.path.exists(state_path) and os.path.exists(store_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state['url'] != url or state['fieldIds'] != fieldIds or state.get('where', '1=1') != kwargs.get('where', '1=1') or state.get('spatialFilter', {}) != spatial:
+            print(f"{store_path} was synced with a different url, fieldIds, where or spatial filter, downloading the whole layer.")
+            state = None
+
+    if state == None:
+        # Nothing to compare against yet, so download the whole layer
+        gdf = gdf_from_services(url, fieldIds=fieldIds, crs=crs, **kwargs)
+    else:
+        stored = _read_store(store_path)
+
+        # Compare object IDs to find the features inserted and deleted since the last sync
+        where = kwargs.get('where', '1=1')
+        server_ids = set(_service_object_ids(url, where, spatial)[1])
+        stored_ids = set(stored[oid_field].astype('int64'))
+        inserted = server_ids - stored_ids
+        deleted = stored_ids - server_ids
+
+        # Ask the server which features have been edited since the last sync
+        updated = set()
+        if editDateField != None:
+            since = datetime.datetime.fromisoformat(state['lastSync']) - datetime.timedelta(minutes=lookback_minutes)
+            # The TIMESTAMP literal is compared with the dates as the layer stores them, which may be local time
+            since = _service_local_time(result, since)
+            edited = f"({where}) AND {editDateField} >= TIMESTAMP '{since.strftime('%Y-%m-%d %H:%M:%S')}'"
+            updated = set(_service_object_ids(url, edited, spatial)[1]) & stored_ids
+        else:
+            print(f"{url} has no edit date field, only syncing inserts and deletes.")
+        print(f"{len(inserted)} inserted, {len(updated)} updated, {len(deleted)} deleted")
+
+        # Download the inserted and edited features and merge them into the stored copy
+        changed = inserted | updated
+        keep = stored.loc[~stored[oid_field].astype('int64').isin(deleted | updated)]
+        if len(changed) > 0:
+            fetched = gdf_from_services(url, fieldIds=fieldIds, crs=crs, objectIds=list(changed), **kwargs)
+            if keep.crs != None and fetched.crs != None:
+                fetched = fetched.to_crs(keep.crs)
+            gdf = pd.concat([keep, fetched], axis='index', ignore_index=True)
+        else:
+            gdf = keep
+        gdf = gpd.GeoDataFrame(gdf, geometry='geometry').sort_values(oid_field).reset_index(drop=True)
+
+    _write_store(gdf, store_path)
+    with open(state_path, 'w') as f:
+        json.dump({'url':url, 'fieldIds':fieldIds, 'where':kwargs.get('where', '1=1'), 'spatialFilter':spatial, 'objectIdField':oid_field, 'editDateField':editDateField, 'lastSync':sync_started.isoformat()}, f, indent=2)
+
+    return(gdf)
+
+# Windows time zone names used by ArcGIS Server in dateFieldsTimeReference, and their IANA names
+_WINDOWS_TIME_ZONES = {
+    'UTC':'UTC',
+    'Coordinated Universal Time':'UTC',
+    'Eastern Standard Time':'America/New_York',
+    'US Eastern Standard Time':'America/Indiana/Indianapolis',
+    'Central Standard Time':'America/Chicago',
+    'Mountain Standard Time':'America/Denver',
+    'US Mountain Standard Time':'America/Phoenix',
+    'Pacific Standard Time':'America/Los_Angeles',
+    'Alaskan Standard Time':'America/Anchorage',
+    'Hawaiian Standard Time':'Pacific/Honolulu',
+}
+
+# Convert a UTC time to the time reference of a layer's date fields.
+def _service_local_time(result, when):
+    """Returns the timezone-aware UTC datetime when as a naive wall-clock time in the time zone that the layer's date
+    fields are stored in (dateFieldsTimeReference in the layer JSON). If the layer doesn't say, or names a time zone
+    that isn't known here, when is moved 14 hours earlier (the largest UTC offset) so that no edit is missed; the
+    features edited in the extra window are only downloaded again."""
+    import datetime
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+    reference = result.get('dateFieldsTimeReference') or {}
+    name = reference.get('timeZone')
+    try:
+        zone = ZoneInfo(_WINDOWS_TIME_ZONES.get(name, name)) if name != None else None
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = None
+    if zone == None:
+        return((when - datetime.timedelta(hours=14)).replace(tzinfo=None))
+    if reference.get('respectsDaylightSaving', True):
+        return(when.astimezone(zone).replace(tzinfo=None))
+    # The dates are kept in standard time all year, so use the zone's offset in January
+    standard = zone.utcoffset(datetime.datetime(when.year, 1, 1))
+    return((when + standard).replace(tzinfo=None))
+
+# Read and write the local copy of a layer kept by sync_service_layer.
+def _read_store(store_path):
+    import geopandas as gpd
+    if store_path.endswith('.parquet'):
+        return(gpd.read_parquet(store_path))
+    return(gpd.read_file(store_path, engine='pyogrio'))
+
+def _write_store(gdf, store_path):
+    import os
+    folder = os.path.dirname(store_path)
+    if folder != '' and not os.path.exists(folder):
+        os.makedirs(folder)
+    # Write to a temporary file first so an interrupted write never leaves a broken store behind
+    temp_path = f"{os.path.splitext(store_path)[0]}.tmp{os.path.splitext(store_path)[1]}"
+    if store_path.endswith('.parquet'):
+        gdf.to_parquet(temp_path)
+    else:
+        gdf.to_file(temp_path, engine='pyogrio')
+    os.replace(temp_path, store_path)
+
+# Get the sorted object IDs of the features in an ArcGIS service feature layer.
+def _service_object_ids(url, where='1=1', filters=None):
+    """Returns the name of the object ID field and a sorted list of the object IDs matching where and any other
+    query parameters in filters (such as a spatial filter)."""
+    r = http_get(f"{url}/query", params=dict(filters or {}, where=where, returnIdsOnly='true', f='json'))
+    result = r.json()
+    if 'objectIds' not in result:
+        print(f"{url} did not return object IDs: {result}")
+        raise RuntimeError
+    # The service returns null instead of an empty list when nothing matches
+    object_ids = sorted(result['objectIds'] or [])
+    return(result['objectIdFieldName'], object_ids)
+
+# Compute summary statistics of an ArcGIS service feature layer on the server.
+def stats_from_services(url, group_by=None, stats=None, where='1=1', geometry=None, spatialRel='esriSpatialRelIntersects', inSR=None):
+    """Creates a DataFrame of summary statistics computed by the ArcGIS Service itself (outStatistics and
+    groupByFieldsForStatistics), so that counts or sums per group take one or two small requests instead of
+    downloading every feature and running groupby locally. Pages through the groups if there are more than the
+    server returns at once.
+
+    Example Usage:
+        by_class = morpcParcels.stats_from_services(parcel_url, group_by='CLASSCD', stats={'OBJECTID':'count', 'ACRES':['sum', 'avg']})
+
+    Parameters:
+    ------------
+    url : str
+        A path to a ArcGIS Service feature layer. 
+
+    group_by : str or list of str
+        The field(s) to group by. None computes the statistics over the whole layer.
+
+    stats : dict
+        Maps field names to a statistic or a list of statistics: count, sum, min, max, avg, stddev or var. The output
+        columns are named "{field}_{statistic}". Defaults to a count of the object ID field.
+
+    where, geometry, spatialRel, inSR
+        Filters applied before the statistics are computed. See iter_service_pages().
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        One row per group, with the group_by fields followed by the statistics.
+    """
+    import json
+    import pandas as pd
+
+    query_url = f"{url}/query"
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if stats == None:
+        stats = {_object_id_field(_service_metadata(url)):'count'}
+
+    out_statistics = []
+    for field, field_stats in stats.items():
+        if isinstance(field_stats, str):
+            field_stats = [field_stats]
+        for stat in field_stats:
+            if stat not in ('count', 'sum', 'min', 'max', 'avg', 'stddev', 'var'):
+                print(f"{stat} is not a statistic, use count, sum, min, max, avg, stddev or var.")
+                raise RuntimeError
+            out_statistics.append({'statisticType':stat, 'onStatisticField':field, 'outStatisticFieldName':f"{field}_{stat}"})
+
+    params = {'where':where, 'outStatistics':json.dumps(out_statistics), 'returnGeometry':'false', 'f':'json'}
+    if group_by != None:
+        params['groupByFieldsForStatistics'] = ",".join(group_by)
+        # A stable order is needed to page through the groups
+        params['orderByFields'] = ",".join(group_by)
+    if geometry != None:
+        params['geometryType'], params['geometry'] = _esri_geometry_param(geometry)
+        params['spatialRel'] = spatialRel
+        if inSR != None:
+            params['inSR'] = inSR
+
+    rows = []
+    offset = 0
+    while True:
+        page_params = dict(params, resultOffset=offset) if offset > 0 else params
+        result = http_get(query_url, params=page_params).json()
+        if 'error' in result:
+            print(f"{url} could not compute the statistics: {result['error']}")
+            raise RuntimeError
+        rows.extend([feat['attributes'] for feat in result['features']])
+        # Keep paging while the server says there are more groups
+        if not result.get('exceededTransferLimit') or len(result['features']) == 0:
+            break
+        offset += len(result['features'])
+
+    columns = (group_by or []) + [stat['outStatisticFieldName'] for stat in out_statistics]
+    df = pd.DataFrame(rows)
+    # Some servers change the case of the output field names, so match them back up without regard to case
+    df = df.rename(columns={column:name for column in df.columns for name in columns if column.lower() == name.lower()})
+    return(df.reindex(columns=columns))
+
+# Stream an ArcGIS service feature layer straight to a GeoPackage or GeoParquet file.
+def services_to_file(url, path, layer=None, fieldIds = None, crs='from_service', **kwargs):
+    """Downloads an ArcGIS Service feature layer page by page and appends each page to a file as it arrives, so memory
+    use stays flat no matter how large the layer is. Paths ending in ".parquet" are written as GeoParquet, anything
+    else is written with pyogrio (e.g. ".gpkg" or ".shp"). An existing file or layer at path is replaced. With
+    returnGeometry=False the attributes are written as plain Parquet or an attribute-only table.
+
+    Example Usage:
+        morpcParcels.services_to_file(parcel_url, './input_data/logan_data/parcels/logan_parcels.gpkg')
+
+    Parameters:
+    ------------
+    url : str
+        A path to a ArcGIS Service feature layer. 
+
+    path : str
+        The file to write to.
+
+    layer : str
+        The layer name to write to for formats that support layers, such as GeoPackage.
+
+    fieldIds : list of str
+        A list of strings that match field ids in the feature layer.
+
+    crs : 'from_service', None, or str to pass to gpd.GeoDataframe.set_crs()
+
+    **kwargs
+        Other keyword arguments, such as max_workers, are passed to iter_service_pages().
+
+    Returns
+    ----------
+    record_count : int
+        The number of records written.
+    """
+    import os
+    import json
+
+    folder = os.path.dirname(path)
+    if folder != '' and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    record_count = 0
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for page in iter_service_pages(url, fieldIds=fieldIds, crs=crs, **kwargs):
+                # Pages requested with returnGeometry=False are plain DataFrames, written as plain Parquet
+                has_geometry = 'geometry' in page.columns and hasattr(page, 'to_arrow')
+                if has_geometry:
+                    table = pa.table(page.to_arrow(geometry_encoding='WKB'))
+                else:
+                    table = pa.Table.from_pandas(page, preserve_index=False)
+                if writer == None:
+                    # Columns that are empty on the first page have no type yet, so store them as strings. Add the
+                    # GeoParquet metadata that tells readers which column holds the WKB geometry and its crs.
+                    schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+                    if has_geometry:
+                        geo = {'version':'1.0.0', 'primary_column':'geometry', 'columns':{'geometry':{
+                            'encoding':'WKB',
+                            'geometry_types':[],
+                            'crs':page.crs.to_json_dict() if page.crs != None else None
+                        }}}
+                        schema = schema.with_metadata({b'geo':json.dumps(geo).encode()})
+                    else:
+                        schema = schema.remove_metadata()
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(table.select(schema.names).cast(schema))
+                record_count += table.num_rows
+        finally:
+            if writer != None:
+                writer.close()
+    else:
+        import pyogrio
+
+        mode = 'w'
+        for page in iter_service_pages(url, fieldIds=fieldIds, crs=crs, **kwargs):
+            if len(page) == 0:
+                continue
+            # pyogrio also writes pages without geometry (returnGeometry=False) as attribute-only tables
+            pyogrio.write_dataframe(page, path, layer=layer, append=(mode == 'a'))
+            mode = 'a'
+            record_count += len(page)
+
+    return(record_count)
+
+# Collect pages of features and build a single GeoDataFrame from them.
+class PageAccumulator:
+    """Collects the pages of a paginated download and builds one GeoDataFrame from them at the end.
+
+    Appending each page to the result with pd.concat copies everything downloaded so far, which is quadratic in the
+    number of pages and doubles peak memory. The accumulator keeps the pages as they arrive and concatenates them
+    in a single pass when to_gdf() is called.
+
+    Example Usage:
+        accumulator = PageAccumulator()
+        for page in pages:
+            accumulator.add(page)
+        gdf = accumulator.to_gdf(crs='EPSG:3735')
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.record_count = 0
+
+    def add(self, page):
+        """Adds a page (a DataFrame or GeoDataFrame) of records."""
+        self.pages.append(page)
+        self.record_count += len(page)
+
+    def to_gdf(self, crs=None, geometry='geometry'):
+        """Concatenates the pages once and returns a GeoDataFrame with a fresh index, or a DataFrame if the pages
+        have no geometry column.
+
+        Parameters:
+        ------------
+        crs : None or str to pass to gpd.GeoDataframe.set_crs()
+
+        geometry : str
+            The name of the geometry column.
+        """
+        import geopandas as gpd
+        import pandas as pd
+
+        if len(self.pages) == 0:
+            gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries([]))
+        elif len(self.pages) == 1:
+            gdf = self.pages[0].reset_index(drop=True)
+        else:
+            gdf = pd.concat(self.pages, axis='index', ignore_index=True)
+
+        # Attribute-only pages (returnGeometry=False) stay a plain DataFrame
+        if geometry not in gdf.columns:
+            return(gdf)
+        gdf = gpd.GeoDataFrame(gdf, geometry=geometry)
+        if crs != None:
+            gdf = gdf.set_crs(crs, allow_override=True)
+        return(gdf)
+
+# Plan the page windows of a layer for iter_service_pages.
+def _plan_offset_windows(totalRecordCount, controller):
+    offset = 0
+    while offset < totalRecordCount:
+        count = controller.size
+        yield {'offset':offset, 'count':count}
+        offset += count
+
+def _plan_id_windows(object_ids, controller, by):
+    i = 0
+    while i < len(object_ids):
+        count = controller.size
+        yield {'ids':object_ids[i:i + count], 'by':by}
+        i += count
+
+# Request one page window, requesting whatever the server left out again in smaller pieces.
+def _fetch_window(query_url, params, window, totalRecordCount, oid_field, controller, crs=None, decoder='auto', spool_dir=None):
+    """Fetches one planned page window. A window is either {'offset', 'count'} for resultOffset paging or {'ids', 'by'}
+    for a list of object IDs requested as an ID range ('range') or with the objectIds parameter ('list'). If the
+    server returns fewer records than the window holds, or the request times out, the page size controller is told
+    and the missing part of the window is requested again in smaller windows.
+    """
+    import requests
+    import pandas as pd
+
+    if 'offset' in window:
+        expected = min(window['count'], totalRecordCount - window['offset'])
+        window_params = dict(params, resultOffset=window['offset'], resultRecordCount=window['count'])
+    else:
+        ids = window['ids']
+        expected = len(ids)
+        if window['by'] == 'range':
+            window_params = dict(params, where=f"({params['where']}) AND {oid_field} >= {ids[0]} AND {oid_field} <= {ids[-1]}")
+        else:
+            window_params = dict(params, objectIds=",".join([str(x) for x in ids]))
+
+    try:
+        page = _fetch_page(query_url, window_params, crs, decoder, spool_dir, controller)
+    except requests.Timeout:
+        controller.record_failure()
+        if expected <= 1:
+            raise
+        page = None
+
+    # An empty page means there is nothing (left) in this window, e.g. because features were deleted since the
+    # count, rather than a truncated response
+    if page is not None and (len(page) >= expected or len(page) == 0 or expected <= 1):
+        return(page)
+
+    # The page was truncated or timed out, so request the rest of the window in smaller pieces
+    if page is not None:
+        controller.record_failure(returned=len(page))
+    if 'offset' in window and page is not None and len(page) > 0:
+        # Offsets are stable, so keep what came back and ask for the remainder
+        parts = [page]
+        rest = [{'offset':window['offset'] + len(page), 'count':window['count'] - len(page)}]
+    elif 'offset' in window:
+        parts = []
+        half = window['count'] // 2
+        rest = [{'offset':window['offset'], 'count':half}, {'offset':window['offset'] + half, 'count':window['count'] - half}]
+    else:
+        # There is no way to tell which IDs are missing without the object ID field, so split the window in half
+        parts = []
+        half = len(ids) // 2
+        rest = [{'ids':ids[:half], 'by':window['by']}, {'ids':ids[half:], 'by':window['by']}]
+    for part in rest:
+        parts.append(_fetch_window(query_url, params, part, totalRecordCount, oid_field, controller, crs, decoder, spool_dir))
+    return(pd.concat(parts, axis='index', ignore_index=True))
+
+# Tune the page size of a layer download to the server's response times and limits.
+class _PageSizeController:
+    """Keeps the page size used by iter_service_pages(page_size='auto'). After every response it estimates the
+    seconds and bytes per feature (smoothed over recent pages) and moves the page size towards the size that would
+    take target_seconds and stay under max_bytes, by at most a factor of two per page. Timeouts and truncated
+    responses halve the page size, and a truncated response also lowers the maximum to what the server returned.
+    With adaptive=False the page size stays fixed, but the maximum is still lowered after a truncated response.
+    """
+
+    def __init__(self, initial, minimum, maximum, target_seconds=3.0, max_bytes=8 * 1024 * 1024, adaptive=True):
+        import threading
+        self.size = int(initial)
+        self.minimum = int(minimum)
+        self.maximum = int(maximum)
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.adaptive = adaptive
+        self.seconds_per_feature = None
+        self.bytes_per_feature = None
+        self.history = []
+        self._lock = threading.Lock()
+
+    def record(self, returned, seconds, size):
+        """Records a completed response of size bytes holding returned features that took seconds."""
+        with self._lock:
+            self.history.append({'page_size':self.size, 'returned':returned, 'seconds':seconds, 'bytes':size})
+            if not self.adaptive or returned == 0:
+                return
+            # Exponentially weighted averages, so one slow page doesn't swing the page size too far
+            spf = seconds / returned
+            bpf = size / returned
+            if self.seconds_per_feature == None:
+                self.seconds_per_feature, self.bytes_per_feature = spf, bpf
+            else:
+                self.seconds_per_feature = 0.7 * self.seconds_per_feature + 0.3 * spf
+                self.bytes_per_feature = 0.7 * self.bytes_per_feature + 0.3 * bpf
+            ideal = min(self.target_seconds / max(self.seconds_per_feature, 1e-9), self.max_bytes / max(self.bytes_per_feature, 1))
+            ideal = min(max(ideal, self.size / 2), self.size * 2)
+            self.size = int(min(max(ideal, self.minimum), self.maximum))
+
+    def record_failure(self, returned=None):
+        """Records a timed out request, or a truncated response holding returned features."""
+        with self._lock:
+            self.history.append({'page_size':self.size, 'returned':returned, 'seconds':None, 'bytes':None})
+            if returned != None and returned > 0:
+                # The server won't send more than this in one response
+                self.maximum = max(min(self.maximum, returned), self.minimum)
+            if self.adaptive:
+                self.size = max(self.size // 2, self.minimum)
+            self.size = min(self.size, self.maximum)
+
+# Request one page of a feature layer and read it into a GeoDataFrame.
+def _fetch_page(query_url, params, crs=None, decoder='auto', spool_dir=None, controller=None):
+    import os
+
+    checkpoint_path = None
+    if spool_dir != None:
+        checkpoint_path = os.path.join(spool_dir, f"{_request_key(query_url, params)}.json")
+        if os.path.exists(checkpoint_path):
+            # This page finished in an earlier run
+            with open(checkpoint_path, 'rb') as f:
+                return(_decode_page(f.read(), params.get('f'), crs, decoder))
+
+    # Request the records selected by params (an offset window or an object ID window). With an adaptive page size a
+    # timeout is raised at once, so that _fetch_window can ask for a smaller page instead of retrying this one
+    adaptive = controller != None and controller.adaptive
+    r = http_get(query_url, params=params, retry_timeouts=not adaptive)
+    # Read this chunk of data into a GeoDataFrame
+    page = _decode_page(r.content, params.get('f'), crs, decoder)
+    # A response from the HTTP cache says nothing about how fast the server is. Time only the attempt that answered,
+    # since waiting for a limiter slot or between retries says nothing about the page size either.
+    if controller != None and not getattr(r, 'from_cache', False):
+        controller.record(len(page), r.attempt_seconds, len(r.content))
+
+    if checkpoint_path != None:
+        # Only keep the response once it has decoded, and write it under a temporary name first so that an
+        # interrupted run never leaves a partial checkpoint behind
+        with open(f"{checkpoint_path}.part", 'wb') as f:
+            f.write(r.content)
+        os.replace(f"{checkpoint_path}.part", checkpoint_path)
+    return(page)
+
+# Read the body of a query response into a GeoDataFrame.
+def _decode_page(content, f='geojson', crs=None, decoder='auto'):
+    import json
+    import geopandas as gpd
+
+    if f == 'json':
+        return(gdf_from_esri_json(json.loads(content), crs=crs))
+    if decoder in ('auto', 'pyogrio'):
+        page = _read_geojson_bytes(content, crs=crs, required=(decoder == 'pyogrio'))
+        if page is not None:
+            return(page)
+    # Extract the GeoJSON from the API response
+    result = json.loads(content)
+    return(gpd.GeoDataFrame.from_features(result["features"], crs=crs))
+
+# Build a short, stable file name from a url and its query parameters.
+def _request_key(url, params=None):
+    import json
+    import hashlib
+
+    return(hashlib.sha1(json.dumps([url, params or {}], sort_keys=True, default=str).encode()).hexdigest()[:20])
+
+# Read a GeoJSON response body into a GeoDataFrame with pyogrio.
+def _read_geojson_bytes(content, crs=None, required=False):
+    """Reads GeoJSON bytes with GDAL through pyogrio, returning None if pyogrio is not installed or cannot read
+    them (unless required is True, in which case the error is raised)."""
+    try:
+        import pyogrio
+        # Keep date-like strings as strings, the way from_features() leaves them, and stop GDAL from trying to
+        # follow exceededTransferLimit to the next page itself
+        page = pyogrio.read_dataframe(content, DATE_AS_STRING='YES', FEATURE_SERVER_PAGING='NO')
+    except Exception:
+        if required:
+            raise
+        return(None)
+    # Match the column order and crs of from_features(): geometry first, then the properties
+    page = page[['geometry'] + [column for column in page.columns if column != 'geometry']]
+    int32_columns = page.select_dtypes('int32').columns
+    page[int32_columns] = page[int32_columns].astype('int64')
+    # GDAL always reads GeoJSON as EPSG:4326, so without a crs clear it as from_features() leaves it
+    page = page.set_crs(crs, allow_override=True)
+    return(page)
+
+# Create a GeoDataFrame from an Esri JSON feature set.
+def gdf_from_esri_json(result, crs=None):
+    """Creates a GeoDataFrame from an Esri JSON feature set, i.e. the response to an ArcGIS query with f=json.
+
+    Parameters:
+    ------------
+    result : dict
+        The parsed JSON response, with "features" and optionally "geometryType".
+
+    crs : None or str to pass to gpd.GeoDataframe.set_crs()
+
+    Returns
+    ----------
+    gdf : geopandas.GeoDataFrame
+    """
+    import pandas as pd
+    import geopandas as gpd
+
+    features = result['features']
+    attributes = pd.DataFrame([feat.get('attributes', {}) for feat in features])
+    geometry = esri_json_to_geoseries(features, geometryType=result.get('geometryType'), crs=crs)
+    return(gpd.GeoDataFrame(attributes, geometry=geometry, crs=crs))
+
+# Decode the geometries of a page of Esri JSON features in bulk.
+def esri_json_to_geoseries(features, geometryType=None, crs=None):
+    """Converts the geometries of a list of Esri JSON features into a GeoSeries without building a shapely object per
+    feature in Python. The coordinates are gathered into flat numpy arrays and the geometries are built all at once
+    with shapely.points() or shapely.from_ragged_array().
+
+    Polygons follow the Esri convention: a clockwise ring starts a new polygon (an exterior ring) and a
+    counterclockwise ring is a hole in the polygon before it, so multipart polygons and holes are kept. Features
+    with one polygon or one path come back as Polygon or LineString, others as MultiPolygon or MultiLineString.
+    Features without a geometry come back as None. Z and M values are dropped.
+
+    Example Usage:
+        geom = morpcParcels.esri_json_to_geoseries(result['features'], result['geometryType'])
 
     Parameters:
     ------------
-    url : str
-        A path to a ArcGIS Service feature layer. 
-        Example: https://services2.arcgis.com/ziXVKVy3BiopMCCU/arcgis/rest/services/Parcel/FeatureServer/0
+    features : list of dict
+        Esri JSON features, each with a "geometry" member.
 
-    fieldIds : list of str
-        A list of strings that match field ids in the feature layer.
+    geometryType : str
+        esriGeometryPoint, esriGeometryMultipoint, esriGeometryPolyline or esriGeometryPolygon. Inferred from the
+        first geometry if None.
 
-    crs : 'from_service', None, or str to pass to gpd.GeoDataframe.set_crs()
+    crs : None or str to pass to gpd.GeoSeries()
 
     Returns
     ----------
-    gdf : pandas.core.frame.DataFrame
-        A GeoPandas GeoDataframe constructed from the GeoJSON requested from the url.
+    geom : geopandas.GeoSeries
     """
-
-    import os
-    import requests
-    import json
-    import re
-    from tqdm import tqdm
+    import numpy as np
+    import shapely
     import geopandas as gpd
-    import pandas as pd
-    from IPython.display import clear_output
 
-    
-    #Construct urls to query for getting total count, json, and geojson
-    count_url = f"{url}/query?outFields=*&where=1%3D1&f=geojson&returnCountOnly=true"
-    json_url = f"{url}/?f=pjson"
-    geojson_url = f"{url}/query?outFields=*&where=1%3D1&f=geojson"
-
-    # Request the total record count from the API
-    r = requests.get(count_url)
-    # Extract the JSON from the API response
-    result = r.json()
-    # Extract the total record count from the JSON
-    totalRecordCount = int(re.findall('[0-9]+',str(r.json()))[0])
+    geoms = [feat.get('geometry') or {} for feat in features]
 
-    # Request JSON and find maxRecordCount
-    r = requests.get(json_url)
-    result = r.json()
-    maxRecordCount = result['maxRecordCount']
-    
-    if crs == 'from_service':
-        crs = result['extent']['spatialReference']['latestWkid']
-    elif crs == None:
-        crs = None
-    else:
-        crs = crs
-        
-    avail_fields = [dict['name'] for dict in result['fields']]
+    if geometryType == None:
+        # Work out the geometry type from the first feature with a geometry
+        geometryType = 'esriGeometryPoint'
+        for geom in geoms:
+            if 'rings' in geom:
+                geometryType = 'esriGeometryPolygon'
+            elif 'paths' in geom:
+                geometryType = 'esriGeometryPolyline'
+            elif 'points' in geom:
+                geometryType = 'esriGeometryMultipoint'
+            elif 'x' not in geom:
+                continue
+            break
 
-    if fieldIds != None:
-        if not set(fieldIds).issubset(avail_fields):
-            print(f"{fieldIds} not in available fields.")
-            raise RuntimeError
-        else:
-            outFields = ",".join(fieldIds)
-            geojson_url = f"{url}/query?outFields={outFields}&where=1%3D1&f=geojson"
+    if geometryType == 'esriGeometryPoint':
+        x = np.array([geom.get('x') for geom in geoms], dtype=float)
+        y = np.array([geom.get('y') for geom in geoms], dtype=float)
+        values = shapely.points(x, y)
+        values[np.isnan(x) | np.isnan(y)] = None
+        return(gpd.GeoSeries(values, crs=crs))
 
-    firstTime = True
-    offset = 0
-    exceededLimit = True
-    print(geojson_url)
-    while offset < totalRecordCount:
-        # print("Downloading records from {}&resultOffset={}&resultRecordCount={}".format(url, offset, recordCount))
-        # Request 2000 records from the API starting with the record indicated by offset. 
-        # Configure the request to include only the required fields, to project the geometries to 
-        # Ohio State Plane South coordinate reference system (EPSG:3735), and to format the data as GeoJSON
-        r = requests.get(f"{geojson_url}&resultOffset={offset}&resultRecordCount={maxRecordCount}")
-        # Extract the GeoJSON from the API response
-        result = r.json()
-     
-        # Read this chunk of data into a GeoDataFrame
-        temp = gpd.GeoDataFrame.from_features(result["features"])
-        if firstTime:
-            # If this is the first chunk of data, create a permanent copy of the GeoDataFrame that we can append to
-            gdf = temp.copy()
-            firstTime = False
+    if geometryType == 'esriGeometryMultipoint':
+        parts = [geom.get('points') or [] for geom in geoms]
+        coords, offsets = _ragged_coords(parts)
+        values = shapely.from_ragged_array(shapely.GeometryType.MULTIPOINT, coords, (offsets,))
+        values[np.diff(offsets) == 0] = None
+        return(gpd.GeoSeries(values, crs=crs))
+
+    if geometryType == 'esriGeometryPolyline':
+        parts = [geom.get('paths') or [] for geom in geoms]
+        paths = [path for part in parts for path in part]
+        coords, path_offsets = _ragged_coords(paths)
+        geom_offsets = np.concatenate([[0], np.cumsum([len(part) for part in parts])])
+        values = shapely.from_ragged_array(shapely.GeometryType.MULTILINESTRING, coords, (path_offsets, geom_offsets))
+        return(gpd.GeoSeries(_simplify_multipart(values, np.diff(geom_offsets)), crs=crs))
+
+    if geometryType == 'esriGeometryPolygon':
+        parts = [geom.get('rings') or [] for geom in geoms]
+        rings = [ring for part in parts for ring in part]
+        coords, ring_offsets = _ragged_coords(rings)
+        rings_per_geom = np.array([len(part) for part in parts], dtype='int64')
+        ring_geom = np.repeat(np.arange(len(parts)), rings_per_geom)
+
+        # Signed area of every ring with the shoelace formula, computed for all rings at once. Clockwise rings have a
+        # negative area. Pairs of points that cross from one ring into the next are masked out.
+        if len(coords) > 1:
+            terms = coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1]
+            point_ring = np.repeat(np.arange(len(rings)), np.diff(ring_offsets))
+            terms[point_ring[:-1] != point_ring[1:]] = 0
+            area = np.bincount(point_ring[:-1], weights=terms, minlength=len(rings))
         else:
-            # If this is not the first chunk, append to the permanent GeoDataFrame
-            gdf = pd.concat([gdf, temp], axis='index')
-     
-        # Increase the offset so that the next request fetches the next chunk of data
-        offset += maxRecordCount
-        print(f"{offset} of {totalRecordCount}")
-        clear_output(wait = True)
-        
-    if crs != None:
-        gdf = gpd.GeoDataFrame(gdf, geometry='geometry').set_crs(crs)
-    else:
-        gdf = gpd.GeoDataFrame(gdf, geometry='geometry')
-        
-    return(gdf)
+            area = np.zeros(len(rings))
+
+        # A ring starts a new polygon if it is clockwise or if it is the first ring of its feature
+        first_ring = np.zeros(len(rings), dtype=bool)
+        first_ring[np.concatenate([[0], np.cumsum(rings_per_geom)])[:-1][rings_per_geom > 0]] = True
+        is_shell = (area < 0) | first_ring
+        poly_offsets = np.concatenate([np.flatnonzero(is_shell), [len(rings)]])
+        polys_per_geom = np.bincount(ring_geom[is_shell], minlength=len(parts))
+        geom_offsets = np.concatenate([[0], np.cumsum(polys_per_geom)])
+        values = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, coords, (ring_offsets, poly_offsets, geom_offsets))
+        return(gpd.GeoSeries(_simplify_multipart(values, polys_per_geom), crs=crs))
+
+    print(f"{geometryType} is not a supported geometry type.")
+    raise RuntimeError
+
+# Flatten a list of coordinate lists into an (n, 2) array and the offsets where each list starts.
+def _ragged_coords(parts):
+    import itertools
+    import numpy as np
+
+    offsets = np.concatenate([[0], np.cumsum([len(part) for part in parts])]).astype('int64')
+    points = list(itertools.chain.from_iterable(parts))
+    if len(points) == 0:
+        return(np.empty((0, 2)), offsets)
+    try:
+        coords = np.array(points, dtype=float)
+    except ValueError:
+        # Points with a mix of XY, XYZ and XYM coordinates do not make a rectangular array
+        coords = np.array([point[:2] for point in points], dtype=float)
+    return(coords[:, :2], offsets)
+
+# Turn multipart geometries with exactly one part into single part geometries, and ones with no parts into None.
+def _simplify_multipart(values, part_counts):
+    import numpy as np
+    import shapely
+
+    values = np.where(part_counts == 1, shapely.get_geometry(values, 0), values)
+    values[part_counts == 0] = None
+    return(values)
+
+# Apply a function to each item using a thread pool, yielding the results in the original order.
+def _map_in_order(func, items, max_workers=1):
+    """Yields func(item) for each item in items, in order. With max_workers > 1 the calls run in a thread pool and
+    only a bounded window of calls is submitted ahead of the one being yielded, so the number of requests in flight
+    and the number of results held in memory stay small no matter how many items there are.
+    """
+    import itertools
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    if max_workers == None or max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    items = iter(items)
+    window = max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(func, item) for item in itertools.islice(items, window))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                # Top the window back up before handing the result over
+                for item in itertools.islice(items, 1):
+                    pending.append(executor.submit(func, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
 
 # Download and unzip a file from a url. 
-def download_and_unzip_archive(url, filename = None, temp_dir = "./temp_data/", keep_zip = False):
-    """Creates a local copy of the contents of a zip archive from a url. 
+def download_and_unzip_archive(url, filename = None, temp_dir = "./temp_data/", keep_zip = False, connections = 1, chunk_size = 1024 * 1024, force = False, extract = True, max_workers = 1):
+    """Creates a local copy of the contents of a zip archive from a url. With extract=False the archive is kept as it
+    is and its layers can be read in place with read_zipped_layer() or a /vsizip/ path from vsizip_path(). A manifest in temp_dir
+    (.download_manifest.json) remembers the ETag, Last-Modified, size and SHA-256 of each archive. If the server
+    says the archive hasn't changed, or it downloads to the same SHA-256, and the extracted files are still there, the
+    archive is neither downloaded nor extracted again. An interrupted download is kept as a .part file and resumed with
+    a Range request on the next call if the server's copy hasn't changed in between.
 
     Parameters:
     -------------
@@ -119,92 +1891,879 @@ def download_and_unzip_archive(url, filename = None, temp_dir = "./temp_data/",
     keep_zip | boolean
     if True keep the zip file in the temp dir, if False deletes zip file after unarchiving
 
+    connections | int
+    The number of connections to download the file over. If the server supports HTTP Range requests, the file is
+    split into that many parts that are downloaded at the same time, otherwise it is downloaded over one connection.
+
+    chunk_size | int
+    The number of bytes read and written at a time.
+
+    force | boolean
+    If True download and extract the archive even if the manifest says the local copy is current.
+
+    extract | boolean or list
+    True extracts every member, False extracts nothing and keeps the zip file whatever keep_zip says, and a list of
+    member names, folder names (e.g. 'Output/FCA_SDE_Web_Prod.gdb') or wildcard patterns (e.g. '*.xlsx') extracts only
+    the matching members.
+
+    max_workers | int
+    The number of threads extracting members at the same time.
+
+    Returns
+    ----------
+    archive_path : str
+        The path of the zip file, which has been deleted unless keep_zip is True or extract is False.
+
     """
     import os
     import re
-    import requests
-    import zipfile
+    import json
+    import time
     import pandas as pd
-    from tqdm import tqdm
+
+    if extract == False:
+        keep_zip = True
     
     # Create folder at location designated by temp_dir
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
 
+    # The manifest of the archives downloaded into temp_dir, by url
+    manifest_path = os.path.join(temp_dir, '.download_manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    download_url = url if filename == None else os.path.join(url, filename)
+    entry = manifest.get(download_url)
+    current = entry != None and not force and entry.get('extract', True) == extract and _extracted_copy_exists(entry, temp_dir, keep_zip)
+
+    # Ask for the archive only if it changed since the extracted copy was made
+    headers = {}
+    if current and entry.get('etag') != None:
+        headers['If-None-Match'] = entry['etag']
+    if current and entry.get('last_modified') != None:
+        headers['If-Modified-Since'] = entry['last_modified']
+    r = http_get(download_url, stream=True, headers=headers)
+    if r.status_code == 304:
+        r.close()
+        print(f"{entry['filename']} has not changed since {entry['downloaded']}, using the copy in {temp_dir}")
+        return(os.path.join(temp_dir, entry['filename']))
+
     # URL for location of data
     if filename == None:
-        r = requests.get(url, stream=True)
-        content_dispo = str(r.headers['content-disposition'])
+        content_dispo = str(r.headers.get('content-disposition', ''))
         if content_dispo != '':
-            filename = str(re.findall('\"(.+)\"', r.headers['content-disposition'])[0])
+            filename = str(re.findall('\"(.+)\"', content_dispo)[0])
         else:
             filename = 'no_filename.zip'
-    else:
-        r = requests.get(os.path.join(url, filename), stream=True)
 
     # Download copy of zip file from url
     archive_path = os.path.join(temp_dir, filename)
     if r.headers.get("Content-Length") != None:
         content_length = pd.to_numeric(r.headers.get("Content-Length"))
     elif r.headers.get('Transfer-Encoding') == 'chunked':
-        content_length = pd.to_numeric(requests.head(os.path.join(url, filename), headers={'Accept-Encoding': None}).headers.get("Content-Length"))
+        content_length = pd.to_numeric(http_request('HEAD', download_url, headers={'Accept-Encoding': None}).headers.get("Content-Length"))
     else:
-        Print("No Content Length on Header")
-        raise RuntimeError
+        print("No Content Length on Header, downloading without a total")
+        content_length = None
+
+    # Download under a temporary name so that an interrupted download can be resumed and is never mistaken for the
+    # whole archive
+    download_file(download_url, f"{archive_path}.part", connections=connections, chunk_size=chunk_size, r=r, content_length=content_length, resume=True)
+    sha256 = _file_sha256(f"{archive_path}.part")
+    os.replace(f"{archive_path}.part", archive_path)
 
-    with tqdm(total=content_length) as pb:
-        with open(archive_path, "wb") as fd:
-            for chunk in r.iter_content(chunk_size=128):
-                fd.write(chunk)
-                pb.update(len(chunk))
-                
-    # Unzip file
-    with zipfile.ZipFile(archive_path) as zip:
-        for zip_info in zip.infolist():
-            zip.extract(zip_info, temp_dir)
+    if current and entry.get('sha256') == sha256:
+        print(f"{filename} downloaded again but has not changed, using the copy in {temp_dir}")
+    else:
+        # Unzip file
+        if extract == False:
+            # The archive is read in place, e.g. with read_zipped_layer()
+            members = []
+        else:
+            members = extract_zip_members(archive_path, temp_dir, None if extract == True else extract, max_workers=max_workers)
+        entry = {'filename':filename, 'members':members, 'extract':extract}
+
+    manifest[download_url] = dict(entry, filename=filename, etag=r.headers.get('ETag'), last_modified=r.headers.get('Last-Modified'),
+                                  size=os.path.getsize(archive_path), sha256=sha256, downloaded=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(f"{manifest_path}.part", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.part", manifest_path)
 
     if keep_zip == False:
         print(f"Removing zip")
         os.unlink(archive_path) # remove zip file
+    return(archive_path)
+
+# Extract some or all of the members of a zip file, optionally in parallel.
+def extract_zip_members(zip_path, temp_dir, members=None, max_workers=1):
+    """Extracts the members of zip_path that match members into temp_dir.
 
-def extract_fields_from_cama(zip_path, filename, columns=None):
+    Example Usage:
+        morpcParcels.extract_zip_members('./input_data/franklin_data/cama/appraisal/Excel.zip', './input_data/franklin_data/cama/appraisal/', ['Build.xlsx', 'Dwelling.xlsx'], max_workers=2)
+
+    Parameters:
+    ------------
+    zip_path : str
+
+    temp_dir : str
+        The folder to extract into.
+
+    members : list
+        Member names, folder names or wildcard patterns. None extracts everything.
+
+    max_workers : int
+        The number of threads extracting at the same time. Each thread reads the archive through its own handle.
+
+    Returns
+    ----------
+    names : list
+        The names of the extracted members.
+    """
+    import zipfile
+
+    with zipfile.ZipFile(zip_path) as zip:
+        names = [name for name in zip.namelist() if members == None or _zip_member_matches(name, members)]
+    if members != None and len(names) == 0:
+        print(f"None of {members} are in {zip_path}.")
+        raise RuntimeError
+
+    def extract_batch(batch):
+        with zipfile.ZipFile(zip_path) as zip:
+            for name in batch:
+                zip.extract(name, temp_dir)
+
+    # Deal the members out round robin so that the threads get a similar mix of large and small files
+    batches = [names[i::max(1, max_workers)] for i in range(max(1, max_workers))]
+    list(_map_in_order(extract_batch, batches, max_workers))
+    return(names)
+
+def _zip_member_matches(name, members):
+    from fnmatch import fnmatch
+
+    for member in members:
+        folder = member.rstrip('/')
+        if name == member or name.startswith(f"{folder}/") or fnmatch(name, member):
+            return(True)
+    return(False)
+
+# Build the GDAL virtual file system path of a file or folder inside a zip file.
+def vsizip_path(zip_path, member=None):
+    """Returns the /vsizip/ path of member inside zip_path (or of the archive itself), which pyogrio and other GDAL
+    based readers open without extracting anything.
+
+    Example Usage:
+        pyogrio.list_layers(morpcParcels.vsizip_path('./input_data/franklin_data/FCA_SDE_Web_Prod.zip', 'Output/FCA_SDE_Web_Prod.gdb'))
+    """
+    import os
+
+    path = f"/vsizip/{os.path.abspath(zip_path)}"
+    if member != None:
+        path = f"{path}/{member.strip('/')}"
+    return(path)
+
+# Read a layer of a shapefile or geodatabase inside a zip file without extracting the archive.
+def read_zipped_layer(zip_path, member=None, layer=None, extract_dir=None, **kwargs):
+    """Reads a layer from a dataset inside a zip file through GDAL's /vsizip/ file system, so the archive doesn't
+    have to be extracted first. If GDAL can't read the dataset from inside the archive, only the dataset's own files
+    (the folder of a geodatabase, or the files sharing a shapefile's name) are extracted and read from disk.
+
+    Example Usage:
+        parcels_raw = morpcParcels.read_zipped_layer('./input_data/franklin_data/FCA_SDE_Web_Prod.zip', 'Output/FCA_SDE_Web_Prod.gdb', layer='TaxParcel_CondoUnitStack_LGIM')
+
+    Parameters:
+    ------------
+    zip_path : str
+
+    member : str
+        The path of the dataset inside the archive, e.g. a .gdb folder or a .shp file. If None the first geodatabase
+        or shapefile in the archive is read.
+
+    layer : str
+        The layer to read from the dataset, as with pyogrio.read_dataframe().
+
+    extract_dir : str
+        The folder to extract the dataset into if it can't be read in place. Defaults to a folder named after the zip
+        file next to it.
+
+    **kwargs
+        Passed to pyogrio.read_dataframe(), e.g. columns, where or bbox.
+
+    Returns
+    ----------
+    gdf : geopandas.geodataframe.GeoDataFrame
+    """
+    import os
+    import zipfile
+    import pyogrio
+
+    if member == None:
+        with zipfile.ZipFile(zip_path) as zip:
+            names = zip.namelist()
+        datasets = [name.split('.gdb/')[0] + '.gdb' for name in names if '.gdb/' in name] + [name for name in names if name.lower().endswith('.shp')]
+        if len(datasets) == 0:
+            print(f"There is no geodatabase or shapefile in {zip_path}.")
+            raise RuntimeError
+        member = datasets[0]
+
+    try:
+        return(pyogrio.read_dataframe(vsizip_path(zip_path, member), layer=layer, **kwargs))
+    except pyogrio.errors.DataSourceError:
+        print(f"{member} could not be read from inside {zip_path}, extracting it")
+
+    # Extract only the files that make up the dataset
+    if extract_dir == None:
+        extract_dir = os.path.splitext(zip_path)[0]
+    if member.lower().endswith('.shp'):
+        patterns = [f"{os.path.splitext(member)[0]}.*"]
+    else:
+        patterns = [member]
+    extract_zip_members(zip_path, extract_dir, patterns)
+    return(pyogrio.read_dataframe(os.path.join(extract_dir, member), layer=layer, **kwargs))
+
+# Record how far each part of a resumable download has got.
+def _save_download_state(state_path, validator, parts):
+    import os
+    import json
+
+    with open(f"{state_path}.part", 'w') as f:
+        json.dump(dict(validator, parts=parts), f)
+    os.replace(f"{state_path}.part", state_path)
+
+# Check that the files extracted from an archive in the download manifest are still there.
+def _extracted_copy_exists(entry, temp_dir, keep_zip):
+    import os
+
+    if keep_zip and not os.path.exists(os.path.join(temp_dir, entry['filename'])):
+        return(False)
+    return(all([os.path.exists(os.path.join(temp_dir, member)) for member in entry.get('members', [])]))
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return(digest.hexdigest())
+
+# Download a url to a file with large reads, throttled progress and optional parallel Range requests.
+def download_file(url, path, connections=1, chunk_size=1024 * 1024, r=None, content_length=None, resume=False):
+    """Downloads url to path. The body is read and written chunk_size bytes at a time and the progress bar is
+    redrawn at most a few times a second, so the download isn't slowed down by Python per small chunk. With
+    connections > 1, a known size and a server that accepts byte ranges (Accept-Ranges: bytes, no Content-Encoding),
+    the file is split into that many parts that are requested with Range headers at the same time and written in
+    place. Parts that are cut off are resumed from where they stopped.
+
+    Example Usage:
+        morpcParcels.download_file('https://apps.franklincountyauditor.com/Outside_User_Files/2024/Excel.zip', './temp_data/Excel.zip', connections=4)
+
+    Parameters:
+    ------------
+    url : str
+
+    path : str
+        The file to write.
+
+    connections : int
+        The number of connections to download the file over.
+
+    chunk_size : int
+        The number of bytes read and written at a time.
+
+    r : requests.Response
+        A streamed response to url that has already been requested, e.g. to read its headers. It is read for a
+        single-connection download and closed otherwise.
+
+    content_length : int
+        The size of the file if it is known from elsewhere, e.g. a HEAD request.
+
+    resume : boolean
+        If True keep the progress of the download in path + '.json' while it runs, and continue a download of the
+        same version of the file (same ETag or Last-Modified, and size) that an earlier call left in path.
+
+    Returns
+    ----------
+    path : str
+    """
+    import os
+    import json
+    import requests
+    from tqdm import tqdm
+
+    if r == None:
+        r = http_get(url, stream=True)
+    if r.status_code != 200:
+        print(f"{url} returned {r.status_code}.")
+        raise RuntimeError
+    if content_length == None and r.headers.get('Content-Length') != None:
+        content_length = r.headers['Content-Length']
+    if content_length != None:
+        content_length = int(content_length)
+
+    ranges_supported = content_length != None and r.headers.get('Accept-Ranges', '').lower() == 'bytes' and r.headers.get('Content-Encoding') in (None, 'identity')
+    validator = {'etag':r.headers.get('ETag'), 'last_modified':r.headers.get('Last-Modified'), 'size':content_length}
+    # Without a validator there is no way to tell whether a partial file is of the same version
+    resume = resume and ranges_supported and (validator['etag'] != None or validator['last_modified'] != None)
+    state_path = f"{path}.json"
+
+    parts = None
+    if resume and os.path.exists(path) and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if all([state.get(key) == value for key, value in validator.items()]):
+            parts = state['parts']
+            print(f"Resuming {os.path.basename(path)} at {sum([part[2] - part[0] for part in parts])} of {content_length} bytes")
+    if parts == None:
+        # Parts much smaller than a few chunks aren't worth another connection
+        connections = max(1, min(int(connections), (content_length or 0) // (4 * chunk_size))) if ranges_supported else 1
+        bounds = [(content_length or 0) * i // connections for i in range(connections + 1)]
+        # [first byte, last byte, next byte to write] of each part
+        parts = [[bounds[i], bounds[i + 1] - 1, bounds[i]] for i in range(connections)]
+        if os.path.exists(state_path):
+            os.unlink(state_path)
+        fresh = True
+    else:
+        fresh = False
+
+    with tqdm(total=content_length, unit='B', unit_scale=True, unit_divisor=1024, mininterval=0.5) as pb:
+        if fresh and len(parts) == 1:
+            try:
+                with open(path, "wb") as fd:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        fd.write(chunk)
+                        pb.update(len(chunk))
+                        if resume:
+                            parts[0][2] += len(chunk)
+                            fd.flush()
+                            _save_download_state(state_path, validator, parts)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if not resume:
+                    raise
+                # The connection dropped, so ask for the rest of the file
+                _download_ranges(url, path, parts, chunk_size, pb, validator, state_path)
+        else:
+            r.close()
+            # Allocate the whole file first so that each part can be written at its own offset
+            with open(path, "wb" if fresh else "r+b") as fd:
+                fd.truncate(content_length)
+            pb.update(sum([part[2] - part[0] for part in parts]))
+            _download_ranges(url, path, parts, chunk_size, pb, validator, state_path if resume else None)
+    if os.path.exists(state_path):
+        os.unlink(state_path)
+    return(path)
+
+# Download the rest of each part of a file with HTTP Range requests, each part over its own connection.
+def _download_ranges(url, path, parts, chunk_size, pb, validator, state_path=None):
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    lock = threading.Lock()
+    # Only accept ranges of the version of the file that the other parts came from
+    if_range = validator['etag'] if validator['etag'] != None else validator['last_modified']
+
+    def fetch_part(part):
+        first, last, position = part
+        attempt = 0
+        with open(path, "r+b") as fd:
+            while position <= last:
+                try:
+                    headers = {'Range':f"bytes={position}-{last}", 'Accept-Encoding':'identity'}
+                    if if_range != None:
+                        headers['If-Range'] = if_range
+                    r = http_get(url, stream=True, headers=headers)
+                    if r.status_code != 206:
+                        r.close()
+                        print(f"{url} did not return the requested range (status {r.status_code}), it may have changed during the download.")
+                        raise RuntimeError
+                    fd.seek(position)
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        fd.write(chunk)
+                        position += len(chunk)
+                        with lock:
+                            part[2] = position
+                            pb.update(len(chunk))
+                            if state_path != None:
+                                fd.flush()
+                                _save_download_state(state_path, validator, parts)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                    # Pick the part up again from the last byte written
+                    if attempt >= TRANSPORT['retries']:
+                        raise
+                    attempt += 1
+        return(position - first)
+
+    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+        futures = [executor.submit(fetch_part, part) for part in parts]
+        for future in futures:
+            future.result()
+    written = sum([part[2] - part[0] for part in parts])
+    if written != validator['size']:
+        print(f"Downloaded {written} of {validator['size']} bytes from {url}.")
+        raise RuntimeError
+
+# Settings for the cache of parsed CAMA tables. Change them with configure_cama_cache().
+CAMA_CACHE = {
+    # Needs pyarrow. Without it CAMA members are parsed every time.
+    'enabled':True,
+    # Directory for the cached tables. None uses ~/.cache/morpcParcels/cama (or $XDG_CACHE_HOME).
+    'path':None,
+}
+
+_archive_hashes = {}
+
+# Change the settings of the CAMA table cache.
+def configure_cama_cache(**settings):
+    """Changes the settings of the cache of parsed CAMA tables used by extract_fields_from_cama() and
+    extract_tables_from_cama().
+
+    Example Usage:
+        morpcParcels.configure_cama_cache(path='./temp_data/cama_cache/')
+
+    Parameters:
+    ------------
+    **settings
+        Any of the keys of morpcParcels.CAMA_CACHE: enabled, path.
+    """
+    for key in settings:
+        if key not in CAMA_CACHE:
+            print(f"{key} is not a CAMA cache setting, use one of {list(CAMA_CACHE)}.")
+            raise RuntimeError
+    CAMA_CACHE.update(settings)
+
+# Remove everything from the CAMA table cache.
+def clear_cama_cache():
+    """Deletes every cached CAMA table."""
+    import shutil
+
+    _archive_hashes.clear()
+    shutil.rmtree(_cama_cache_dir(), ignore_errors=True)
+
+def _cama_cache_dir():
+    return(CAMA_CACHE['path'] if CAMA_CACHE['path'] != None else _default_cache_dir('cama'))
+
+# Get the SHA-256 of an archive, hashing it only when its size or modification time has changed.
+def _archive_sha256(zip_path):
+    import os
+    import json
+    import shutil
+
+    path = os.path.abspath(zip_path)
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if _archive_hashes.get(path, {}).get('signature') != signature:
+        index_path = os.path.join(_cama_cache_dir(), 'archives.json')
+        index = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+        if index.get(path, {}).get('signature') != signature:
+            old = index.get(path, {}).get('sha256')
+            index[path] = {'signature':signature, 'sha256':_file_sha256(path)}
+            # Drop the tables of the archive's previous contents unless another archive has the same contents
+            if old != None and old not in [entry['sha256'] for entry in index.values()]:
+                shutil.rmtree(os.path.join(_cama_cache_dir(), old), ignore_errors=True)
+            try:
+                os.makedirs(_cama_cache_dir(), exist_ok=True)
+                with open(f"{index_path}.{os.getpid()}.part", 'w') as f:
+                    json.dump(index, f, indent=2)
+                os.replace(f"{index_path}.{os.getpid()}.part", index_path)
+            except OSError:
+                # The index is only an optimization, so an unwritable cache directory just means hashing again
+                pass
+        _archive_hashes[path] = index[path]
+    return(_archive_hashes[path]['sha256'])
+
+# Read the requested columns of a CAMA member from the cache, if they are there.
+def _read_cama_cache(path, columns, as_arrow=False):
+    import numpy as np
+    import pyarrow as pa
+
+    # The Arrow IPC file is memory mapped, so only the requested columns are read from disk
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        complete = (table.schema.metadata or {}).get(b'morpcParcels.complete') == b'true'
+        if (columns == None and not complete) or (columns != None and not set(columns) <= set(table.column_names)):
+            return(None, table.column_names)
+        if columns != None:
+            table = table.select(list(columns))
+        if as_arrow:
+            return(table, table.column_names)
+        df = table.to_pandas()
+    # Missing values come back as None, so turn them back into the NaN that the parsers give
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return(df, table.column_names)
+
+# Store the parsed columns of a CAMA member in the cache.
+def _write_cama_cache(path, data, complete):
+    import os
+    import pandas as pd
+    import pyarrow as pa
+
+    if isinstance(data, pd.DataFrame):
+        try:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # e.g. a spreadsheet column holding both numbers and text, which Arrow can't store as one type
+            return
+    else:
+        table = data
+    # Remember whether the table holds every column of the member or only the ones asked for so far
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'morpcParcels.complete'] = b'true' if complete else b'false'
+    table = table.replace_schema_metadata(metadata)
+    part = f"{path}.{os.getpid()}.part"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with pa.OSFile(part, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(part, path)
+    except OSError:
+        # The cache is only an optimization, so an unwritable cache directory just means parsing again next time
+        return
+
+def extract_fields_from_cama(zip_path, filename, columns=None, engine='pandas', filters=None, sheet_name=0):
+    """Reads a table from a member of a CAMA zip archive (.xml, .csv, pipe delimited .txt or .xlsx).
+
+    Example Usage:
+        building = morpcParcels.extract_fields_from_cama('./morrow_data/cama/morrowoh.zip', 'GovernmaxBuildingExtract.txt', columns=['PropertyNumber', 'UseCode', 'YearBuilt'], engine='pyarrow', filters=[('UseCode', 'in', ['510', '550'])])
+
+    Parameters:
+    ------------
+    zip_path : str
+
+    filename : str
+        The name of the member inside the archive.
+
+    columns : list
+        The columns to read. None reads all of them.
+
+    engine : str
+        'pandas' reads csv and txt members with pd.read_csv(dtype='str') into object columns. 'pyarrow' and 'polars'
+        parse them on several threads with pyarrow.csv or polars, keep every column as text, and return Arrow backed
+        pd.ArrowDtype(string) columns with <NA> for missing values. xlsx members are read with the calamine reader
+        when it is installed (python-calamine for 'pandas' and 'pyarrow', fastexcel for 'polars'), which is much
+        faster than openpyxl, and only the requested columns are built. Other member types are parsed as with 'pandas'
+        and converted to Arrow backed columns.
+
+    filters : list
+        Rows to keep, in the disjunctive normal form used by pyarrow.parquet: a list of (column, op, value) tuples that
+        must all hold, or a list of such lists of which one must hold. op is one of '=', '==', '!=', '<', '>', '<=',
+        '>=', 'in' and 'not in'. Values are compared as text, e.g. ('YearBuilt', '>=', '2000').
+
+    sheet_name : int or str
+        The sheet of an xlsx member to read, by position or name.
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+    """
+    return(_read_cama_member(zip_path, filename, columns, engine, filters, sheet_name))
+
+# Read several tables from the members of a CAMA archive in one pass.
+def extract_tables_from_cama(zip_path, tables, max_workers=1, engine='pandas'):
+    """Reads several tables out of one CAMA zip archive. Tables that come from the same member are read in a single
+    parse of that member with the union of their columns and then split up, and different members are parsed at the
+    same time in up to max_workers workers. The pyarrow and polars engines parse outside of the GIL, so their workers
+    are threads; the pandas engine uses processes, started with 'spawn' so that they don't inherit locks (e.g. of
+    polars' thread pool) held in the parent. Like any spawned worker they import the calling script again, so a
+    script run with python (rather than as a notebook) needs an if __name__ == '__main__': guard for max_workers > 1.
+
+    Example Usage:
+        tables = morpcParcels.extract_tables_from_cama('./input_data/madison_data/cama/PublicRecordsExtract.zip', {
+            'build':('Parcel Building.xml', ['Parcel_Number', 'Card', 'Year_Built', 'Year_Effective']),
+            'land_use':('Parcel Appraisal.xml', ['Parcel_Number', 'Land_Use_Code']),
+            'appr_tot':('Parcel Appraisal.xml', ['Parcel_Number', 'Total_Appraised_Improvement', 'Total_Appraised_Land']),
+        }, max_workers=3)
+
+    Parameters:
+    ------------
+    zip_path : str
+
+    tables : dict
+        Either {table name: (member name, columns)}, {table name: (member name, columns, filters)} or {member name:
+        columns}. columns is a list of column names, or None for all of them, and filters selects rows, as with
+        extract_fields_from_cama().
+
+    max_workers : int
+        The number of members parsed at the same time.
+
+    engine : str
+        'pandas', 'pyarrow' or 'polars', as with extract_fields_from_cama().
+
+    Returns
+    ----------
+    tables : dict
+        {table name: pandas.DataFrame}, in the order of the tables argument.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    # Work out which columns are needed from each member, including the ones that the filters look at
+    projections = {}
+    for name, spec in tables.items():
+        spec = spec if isinstance(spec, tuple) else (name, spec)
+        member, columns, filters = spec if len(spec) == 3 else (spec[0], spec[1], None)
+        projections[name] = (member, columns, filters)
+    members = {}
+    for member, columns, filters in projections.values():
+        needed = None if columns == None else list(columns) + [column for column in _filter_columns(filters) if column not in columns]
+        if member in members and (members[member] == None or needed == None):
+            members[member] = None
+        elif member in members:
+            members[member] = members[member] + [column for column in needed if column not in members[member]]
+        else:
+            members[member] = needed
+
+    if max_workers == None or max_workers <= 1 or len(members) == 1:
+        frames = {member:_read_cama_member(zip_path, member, columns, engine) for member, columns in members.items()}
+    else:
+        if engine == 'pandas':
+            executor = ProcessPoolExecutor(max_workers=min(max_workers, len(members)), mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=min(max_workers, len(members)))
+        with executor:
+            futures = {member:executor.submit(_read_cama_member, zip_path, member, columns, engine) for member, columns in members.items()}
+            frames = {member:future.result() for member, future in futures.items()}
+
+    results = {}
+    for name, (member, columns, filters) in projections.items():
+        df = frames[member]
+        if filters == None and (columns == None or list(columns) == members[member]):
+            # The member was read for this table alone
+            results[name] = df if len([spec for spec in projections.values() if spec[0] == member]) == 1 else df.copy()
+            continue
+        if filters != None:
+            df = df[_filter_rows(df, filters)].reset_index(drop=True)
+        results[name] = df.copy() if columns == None else df[list(columns)].copy()
+    return(results)
+
+# Read one member of a CAMA archive into a DataFrame of strings.
+def _read_cama_member(zip_path, filename, columns=None, engine='pandas', filters=None, sheet_name=0):
+    """Returns the columns of member filename of zip_path, in the order they are asked for, keeping the rows that
+    match filters.
+    """
+    import pandas as pd
+
+    if engine not in ('pandas', 'pyarrow', 'polars'):
+        print(f"{engine} is not a CAMA engine, use 'pandas', 'pyarrow' or 'polars'.")
+        raise RuntimeError
+
+    needed = columns
+    if columns != None and filters != None:
+        needed = list(columns) + [column for column in _filter_columns(filters) if column not in columns]
+    data = _load_cama_member(zip_path, filename, needed, engine, sheet_name)
+
+    if isinstance(data, pd.DataFrame):
+        if filters != None:
+            data = data[_filter_rows(data, filters)].reset_index(drop=True)
+        return(data if columns == None else data[list(columns)])
+
+    # Filter and project while the table is still in Arrow, so only the rows and columns asked for are converted
+    if filters != None:
+        import pyarrow.parquet as pq
+        data = data.filter(pq.filters_to_expression(filters))
+    if columns != None:
+        data = data.select(list(columns))
+    return(data.to_pandas(types_mapper=pd.ArrowDtype))
+
+# Parse a member of a CAMA archive, or take it from the CAMA cache.
+def _load_cama_member(zip_path, filename, columns=None, engine='pandas', sheet_name=0):
+    """Returns the member as a DataFrame (engine='pandas') or a pyarrow Table (the other engines). Parsed members are
+    cached as Arrow IPC files under the SHA-256 of the archive, so a new archive is parsed again. A cached member that
+    lacks some of the requested columns is parsed again for those and the cached ones together.
+    """
+    import os
+
+    use_cache = CAMA_CACHE['enabled']
+    try:
+        import pyarrow
+    except ImportError:
+        use_cache = False
+    if not use_cache:
+        return(_parse_cama_member(zip_path, filename, columns, engine, sheet_name))
+
+    # Each sheet of a workbook is cached on its own
+    member_key = _request_key(filename) if sheet_name == 0 else _request_key(filename, {'sheet_name':sheet_name})
+    cache_path = os.path.join(_cama_cache_dir(), _archive_sha256(zip_path), f"{member_key}.arrow")
+    cached_columns = None
+    if os.path.exists(cache_path):
+        try:
+            data, cached_columns = _read_cama_cache(cache_path, columns, as_arrow=(engine != 'pandas'))
+        except (OSError, pyarrow.ArrowInvalid):
+            # An unreadable or truncated cache file is parsed again and replaced
+            data, cached_columns = None, None
+        if data is not None:
+            return(data)
+
+    # Parse the member with the cached columns too, so that the cache only grows
+    parse_columns = columns
+    if columns != None and cached_columns != None:
+        parse_columns = cached_columns + [column for column in columns if column not in cached_columns]
+    data = _parse_cama_member(zip_path, filename, parse_columns, engine, sheet_name)
+    _write_cama_cache(cache_path, data, parse_columns == None)
+    return(data)
+
+# Parse one member of a CAMA archive into a DataFrame of strings, or a pyarrow Table of strings.
+def _parse_cama_member(zip_path, filename, columns=None, engine='pandas', sheet_name=0):
+    import io
+    import csv
     import zipfile
-    import xml.etree.ElementTree as ET
     import pandas as pd
-    import random
 
     with zipfile.ZipFile(zip_path) as z:
-        for file in z.namelist():
-            if file == filename:
-                file_type = file.split(".")[-1]
-                with z.open(file) as data:
-                    if file_type == "xml":
-                        et = ET.parse(data)
-                        root = et.getroot()
-                        dicts = []
-                        for child in root:
-                            dicts.append(child.attrib)
-                        if columns==None:
-                            df = pd.DataFrame(dicts)
-                        else:
-                            df = pd.DataFrame(dicts)[columns]
-                    if file_type == "csv":
-                        if columns == None:
-                            df = pd.read_csv(data, dtype = 'str')
-                        else:
-                            df = pd.read_csv(data, dtype = 'str', usecols = columns)
-                    if file_type == "txt":
-                        if columns == None:
-                            df = pd.read_csv(data, sep = "|", dtype="str")
-                        else:
-                            df = pd.read_csv(data, sep = "|", dtype="str", usecols = columns)
-                    if file_type == "xlsx":
-                        if columns == None:
-                            df = pd.read_excel(data)
-                        else:
-                            df = pd.read_excel(data, usecols = columns)
+        if filename not in z.namelist():
+            print(f"{filename} is not in {zip_path}.")
+            raise RuntimeError
+        file_type = filename.split(".")[-1]
+        sep = "|" if file_type == "txt" else ","
+        if engine == 'polars' and file_type in ("csv", "txt"):
+            import polars as pl
+            with z.open(filename) as data:
+                # infer_schema_length=0 reads every column as text
+                return(pl.read_csv(data.read(), separator=sep, columns=columns, infer_schema_length=0).to_arrow())
+        if engine == 'polars' and file_type == "xlsx":
+            import polars as pl
+            with z.open(filename) as data:
+                sheet = {'sheet_name':sheet_name} if isinstance(sheet_name, str) else {'sheet_id':sheet_name + 1}
+                return(pl.read_excel(data.read(), engine='calamine', columns=columns, **sheet).to_arrow())
+        if engine == 'pyarrow' and file_type in ("csv", "txt"):
+            import pyarrow as pa
+            from pyarrow import csv as pacsv
+            # Read the header first, so that every column can be typed as text
+            with io.TextIOWrapper(z.open(filename), encoding='utf-8-sig') as text:
+                header = next(csv.reader(text, delimiter=sep))
+            with z.open(filename) as data:
+                return(pacsv.read_csv(data, parse_options=pacsv.ParseOptions(delimiter=sep),
+                                      convert_options=pacsv.ConvertOptions(include_columns=columns, column_types={name:pa.string() for name in header}, strings_can_be_null=True)))
+        with z.open(filename) as data:
+            if file_type == "xml":
+                df = _read_xml_records(data, columns)
+            if file_type == "csv":
+                if columns == None:
+                    df = pd.read_csv(data, dtype = 'str')
+                else:
+                    df = pd.read_csv(data, dtype = 'str', usecols = columns)
+            if file_type == "txt":
+                if columns == None:
+                    df = pd.read_csv(data, sep = "|", dtype="str")
+                else:
+                    df = pd.read_csv(data, sep = "|", dtype="str", usecols = columns)
+            if file_type == "xlsx":
+                # calamine needs to seek around the workbook, which is slow on a compressed zip member
+                workbook = io.BytesIO(data.read())
+                if columns == None:
+                    df = pd.read_excel(workbook, sheet_name = sheet_name, engine = _excel_engine())
+                else:
+                    df = pd.read_excel(workbook, sheet_name = sheet_name, usecols = columns, engine = _excel_engine())
+    if engine != 'pandas':
+        import pyarrow as pa
+        try:
+            return(pa.Table.from_pandas(df, preserve_index=False))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Arrow can't hold this member (e.g. mixed types in a spreadsheet column), so leave it to pandas
+            pass
     return(df)
 
+# Pick the fastest installed reader for pd.read_excel.
+def _excel_engine():
+    try:
+        import python_calamine
+        return('calamine')
+    except ImportError:
+        # pandas falls back to openpyxl
+        return(None)
+
+# List the columns that row filters look at.
+def _filter_columns(filters):
+    if filters == None or len(filters) == 0:
+        return([])
+    groups = filters if isinstance(filters[0], list) else [filters]
+    columns = []
+    for group in groups:
+        for column, op, value in group:
+            if column not in columns:
+                columns.append(column)
+    return(columns)
+
+# Evaluate row filters in disjunctive normal form against a DataFrame.
+def _filter_rows(df, filters):
+    """Returns a boolean mask of the rows of df that match filters (see extract_fields_from_cama())."""
+    import operator
+    import pandas as pd
+
+    ops = {'=':operator.eq, '==':operator.eq, '!=':operator.ne, '<':operator.lt, '>':operator.gt, '<=':operator.le, '>=':operator.ge}
+    groups = filters if isinstance(filters[0], list) else [filters]
+    keep = pd.Series(False, index=df.index)
+    for group in groups:
+        match = pd.Series(True, index=df.index)
+        for column, op, value in group:
+            if op == 'in':
+                condition = df[column].isin(value)
+            elif op == 'not in':
+                condition = ~df[column].isin(value)
+            elif op in ops:
+                condition = ops[op](df[column], value)
+            else:
+                print(f"{op} is not a filter operator, use one of {list(ops) + ['in', 'not in']}.")
+                raise RuntimeError
+            # Missing values never match, as with pyarrow
+            match = match & condition.fillna(False).astype(bool) & df[column].notna()
+        keep = keep | match
+    return(keep)
+
+# Read the attributes of the record elements of an XML document into columns, one element at a time.
+def _read_xml_records(data, columns=None):
+    """Reads an XML document whose root element holds one element per record, with the fields as attributes (e.g.
+    <Parcel_Number="..." Card="..."/>), into a DataFrame. The document is parsed with iterparse and each record is
+    cleared once its attributes have been copied, so only the requested columns are held in memory, never the whole
+    tree. Records missing an attribute get NaN, as with pd.DataFrame(list of dicts).
+    """
+    import xml.etree.ElementTree as ET
+    import numpy as np
+    import pandas as pd
+
+    values = {} if columns == None else {column:[] for column in columns}
+    rows = 0
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(data, events=('start', 'end')):
+        if event == 'start':
+            if root == None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            # Only the children of the root are records
+            continue
+        attrib = elem.attrib
+        if columns == None:
+            # Columns appear in the order they are first seen, as with pd.DataFrame(list of dicts)
+            for name in attrib:
+                if name not in values:
+                    values[name] = [np.nan] * rows
+        for name, column in values.items():
+            column.append(attrib.get(name, np.nan))
+        rows += 1
+        # Drop the record, and the root's reference to it, so the parsed tree never grows
+        elem.clear()
+        root.clear()
+
+    if columns != None:
+        missing = [column for column in columns if rows > 0 and all([value is np.nan for value in values[column]])]
+        if len(missing) > 0:
+            print(f"{missing} are not attributes of the records.")
+            raise RuntimeError
+    return(pd.DataFrame(values, columns=list(values)))
+
 def sample_columns_from_df(df):
     import pandas as pd
     import random
@@ -58,8 +58,12 @@ morpcParcels.download_and_unzip_archive(url='https://share.pivotpoint.us/oh/morr
 
 # %%
 morrow_parcels = pyogrio.read_dataframe('./morrow_data/parcels/Morrow_Parcels.shp').set_index('Name')
-morrow_building = morpcParcels.extract_fields_from_cama(zip_path='./morrow_data/cama/morrowoh.zip', filename='GovernmaxBuildingExtract.txt', columns=['PropertyNumber', 'UseCode', 'YearBuilt']).set_index('PropertyNumber')
-morrow_dwelling = morpcParcels.extract_fields_from_cama(zip_path='./morrow_data/cama/morrowoh.zip', filename='GovernmaxDwellingExtract.txt', columns=['PropertyNumber', 'UseCode', 'YearBuilt']).set_index('PropertyNumber')
+cama = morpcParcels.extract_tables_from_cama(zip_path='./morrow_data/cama/morrowoh.zip', tables={
+    'GovernmaxBuildingExtract.txt':['PropertyNumber', 'UseCode', 'YearBuilt'],
+    'GovernmaxDwellingExtract.txt':['PropertyNumber', 'UseCode', 'YearBuilt'],
+}, max_workers=2, engine='pyarrow')
+morrow_building = cama['GovernmaxBuildingExtract.txt'].set_index('PropertyNumber')
+morrow_dwelling = cama['GovernmaxDwellingExtract.txt'].set_index('PropertyNumber')
 morrow_dwelling = morrow_dwelling.join(morrow_parcels[['geometry', 'A_Acreage']]).dropna()
 morrow_building = morrow_building.join(morrow_parcels[['geometry', 'A_Acreage']]).dropna()
 morrow_parcels = pd.concat([morrow_dwelling, morrow_building])
@@ -0,0 +1,83 @@
+# ---
+# jupyter:
+#   jupytext:
+#     formats: ipynb,py:percent
+#     text_representation:
+#       extension: .py
+#       format_name: percent
+#       format_version: '1.3'
+#       jupytext_version: 1.16.4
+#   kernelspec:
+#     display_name: Python 3 (ipykernel)
+#     language: python
+#     name: python3
+# ---
+
+# %% [markdown]
+# # Page Accumulator Benchmark
+#
+# Compares building a layer by running `pd.concat([gdf, temp])` after every page (the old pagination loops) against
+# collecting the pages in `morpcParcels.PageAccumulator` and concatenating once. The pages are synthetic point pages
+# shaped like a parcel layer, so no network access is needed.
+
+# %%
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+sys.path.append(os.path.normpath('../morpc-parcel-fetch/'))
+import morpcParcels
+
+# %%
+PAGE_SIZE = 2000
+PAGE_COUNTS = [10, 50, 100, 200, 400]
+
+def make_page(i):
+    rng = np.random.default_rng(i)
+    return(gpd.GeoDataFrame({
+        'PARCELID':[f"{i:04d}-{j:05d}" for j in range(PAGE_SIZE)],
+        'CLASSCD':rng.choice(['510', '550', '401', '100'], PAGE_SIZE),
+        'ACRES':rng.random(PAGE_SIZE),
+        'YRBUILT':rng.integers(1850, 2024, PAGE_SIZE)
+    }, geometry=gpd.points_from_xy(rng.random(PAGE_SIZE), rng.random(PAGE_SIZE))))
+
+# %%
+def repeated_concat(pages):
+    firstTime = True
+    for temp in pages:
+        if firstTime:
+            gdf = temp.copy()
+            firstTime = False
+        else:
+            gdf = pd.concat([gdf, temp], axis='index')
+    return(gdf)
+
+def accumulate(pages):
+    accumulator = morpcParcels.PageAccumulator()
+    for temp in pages:
+        accumulator.add(temp)
+    return(accumulator.to_gdf())
+
+# %%
+results = []
+for page_count in PAGE_COUNTS:
+    pages = [make_page(i) for i in range(page_count)]
+    timings = {}
+    for name, func in [('repeated_concat', repeated_concat), ('accumulator', accumulate)]:
+        start = time.perf_counter()
+        gdf = func(pages)
+        timings[name] = time.perf_counter() - start
+        assert len(gdf) == page_count * PAGE_SIZE
+    results.append({
+        'pages':page_count,
+        'records':page_count * PAGE_SIZE,
+        'repeated_concat_s':round(timings['repeated_concat'], 3),
+        'accumulator_s':round(timings['accumulator'], 3),
+        'speedup':round(timings['repeated_concat'] / timings['accumulator'], 1)
+    })
+
+# %%
+print(pd.DataFrame(results).to_string(index=False))
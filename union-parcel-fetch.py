@@ -38,7 +38,7 @@ sys.path.append(os.path.normpath('../morpc-parcel-fetch/'))
 import morpcParcels
 
 # %%
-parcels_raw = morpcParcels.gdf_from_services('https://www7.co.union.oh.us/unioncountyohio/rest/services/ParcelAllSaleinfoBuildingInfo/MapServer/1', crs=None)
+parcels_raw = morpcParcels.gdf_from_services('https://www7.co.union.oh.us/unioncountyohio/rest/services/ParcelAllSaleinfoBuildingInfo/MapServer/1', crs=None, pagination='tiles', max_workers=4)
 
 # %%
 addr_raw = morpcParcels.gdf_from_services('https://www7.co.union.oh.us/unioncountyohio/rest/services/Address/FeatureServer/0', crs=None)